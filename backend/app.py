@@ -1,14 +1,30 @@
+import asyncio
+import base64
+import contextvars
+import hashlib
 import json
+import multiprocessing
 import os
+import secrets
 import sqlite3
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
 
 from fastapi import FastAPI, HTTPException, Request, Query, Body, Response  #type: ignore
 from fastapi.middleware.cors import CORSMiddleware #type: ignore
-from fastapi.responses import JSONResponse #type: ignore
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse #type: ignore
 from pydantic import BaseModel #type: ignore
 import uvicorn #type: ignore
+from anyio import to_thread #type: ignore
+
+from lib.db import close_all, connect, thread_connection
+from lib.metrics import METRICS_ENABLED, end_request, http_seconds, register_cache, render, server_timing, start_request
+from lib.sessions import SessionCache, SessionSweeper
 
 
 class LoginRequest(BaseModel):
@@ -19,9 +35,16 @@ class LoginRequest(BaseModel):
 DATABASE_PATH = os.environ.get("ECHO_DB", os.path.join(os.path.dirname(__file__), "echo.db"))
 
 def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # One WAL-mode connection per thread, reused across requests. Use it as
+    # `with get_connection() as conn:` so each block is a single transaction.
+    return thread_connection(DATABASE_PATH)
+
+def begin_write(conn: sqlite3.Connection) -> None:
+    # Take the write lock up front so a read-modify-write (old row, then
+    # rollup deltas) cannot interleave with another writer. No-op if this
+    # block already holds a transaction.
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
 
 def init_db() -> None:
     with get_connection() as conn:
@@ -66,46 +89,303 @@ def init_db() -> None:
                 user_id TEXT,
                 currentDate TEXT,
                 expiryDate TEXT,
+                token TEXT,
                 FOREIGN KEY (user_id) REFERENCES auth_data(user_id) ON DELETE CASCADE
 );
             """
         )
 
 
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entry_analysis (
+                entry_id INTEGER PRIMARY KEY,
+                text_hash TEXT,
+                analysis TEXT,
+                updated_at TEXT,
+                FOREIGN KEY (entry_id) REFERENCES journal_entries(id) ON DELETE CASCADE
+            );
+            """
+        )
+
+
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entry_shares (
+                entry_id INTEGER NOT NULL,
+                recipient_id TEXT NOT NULL,
+                shared_at TEXT,
+                PRIMARY KEY (entry_id, recipient_id),
+                FOREIGN KEY (entry_id) REFERENCES journal_entries(id) ON DELETE CASCADE
+            );
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entry_shares_recipient ON entry_shares(recipient_id, entry_id)")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entry_liked_tracks (
+                entry_id INTEGER NOT NULL,
+                track_id TEXT NOT NULL,
+                liked_at TEXT,
+                PRIMARY KEY (entry_id, track_id),
+                FOREIGN KEY (entry_id) REFERENCES journal_entries(id) ON DELETE CASCADE
+            );
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entry_liked_tracks_track ON entry_liked_tracks(track_id, entry_id)")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS mood_rollups (
+                user_id TEXT NOT NULL,
+                period TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                dimension TEXT NOT NULL,
+                value TEXT NOT NULL,
+                entries INTEGER NOT NULL DEFAULT 0,
+                intensity_sum INTEGER NOT NULL DEFAULT 0,
+                intensity_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, period, bucket, dimension, value)
+            );
+            """
+        )
+
+        run_migrations(conn)
         conn.commit()
 
+def format_ts(dt: datetime) -> str:
+    # Fixed-width ISO-8601 (always with microseconds) so timestamps sort
+    # lexically and the (user_id, timestamp) index can serve ORDER BY.
+    return dt.isoformat(timespec="microseconds")
+
+def normalize_ts(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return value
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return format_ts(dt)
+
+def migrate_entry_timestamps(conn: sqlite3.Connection) -> None:
+    rows = conn.execute("SELECT id, timestamp FROM journal_entries").fetchall()
+    updates = [(normalize_ts(row["timestamp"]), row["id"]) for row in rows]
+    conn.executemany(
+        "UPDATE journal_entries SET timestamp = ? WHERE id = ?",
+        [(ts, entry_id) for (ts, entry_id), row in zip(updates, rows) if ts != row["timestamp"]],
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_user_ts ON journal_entries(user_id, timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_ts ON journal_entries(timestamp)")
+
+def migrate_entry_links(conn: sqlite3.Connection) -> None:
+    # shared_to / liked_tracks used to be JSON arrays on the entry row; the
+    # junction tables are the source of truth from here on.
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO entry_shares (entry_id, recipient_id)
+        SELECT e.id, j.value FROM journal_entries e, json_each(e.shared_to) j
+        WHERE json_valid(e.shared_to) AND j.value IS NOT NULL
+        """
+    )
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO entry_liked_tracks (entry_id, track_id)
+        SELECT e.id, j.value FROM journal_entries e, json_each(e.liked_tracks) j
+        WHERE json_valid(e.liked_tracks) AND j.value IS NOT NULL
+        """
+    )
+
+def rollup_buckets(timestamp: str) -> List[tuple]:
+    day = datetime.fromisoformat(timestamp).date()
+    week = day - timedelta(days=day.weekday())
+    return [("day", day.isoformat()), ("week", week.isoformat())]
+
+def rollup_values(mood: Optional[str], analysis: Optional[Dict[str, Any]]) -> List[tuple]:
+    values = [("mood", mood)] if mood else []
+    if analysis:
+        values += [("sentiment", analysis["sentiment"]), ("emotion", analysis["emotion"])]
+    return values
+
+def apply_rollup(conn: sqlite3.Connection, user_id: str, timestamp: str, values: List[tuple],
+                 intensity: Optional[int], sign: int) -> None:
+    """Add (sign=1) or remove (sign=-1) one entry's contribution to mood_rollups.
+
+    mood_intensity is only accumulated on the mood dimension.
+    """
+    if not values or not timestamp:
+        return
+    rows = []
+    for period, bucket in rollup_buckets(timestamp):
+        for dimension, value in values:
+            counted = intensity is not None and dimension == "mood"
+            rows.append((
+                user_id, period, bucket, dimension, value, sign,
+                sign * intensity if counted else 0, sign if counted else 0,
+            ))
+    conn.executemany(
+        """
+        INSERT INTO mood_rollups (user_id, period, bucket, dimension, value, entries, intensity_sum, intensity_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, period, bucket, dimension, value) DO UPDATE SET
+            entries = entries + excluded.entries,
+            intensity_sum = intensity_sum + excluded.intensity_sum,
+            intensity_count = intensity_count + excluded.intensity_count
+        """,
+        rows,
+    )
+    if sign < 0:
+        conn.executemany(
+            "DELETE FROM mood_rollups WHERE user_id = ? AND period = ? AND bucket = ? AND dimension = ? AND value = ? AND entries <= 0",
+            [row[:5] for row in rows],
+        )
+
+def migrate_mood_rollups(conn: sqlite3.Connection) -> None:
+    conn.execute("DELETE FROM mood_rollups")
+    rows = conn.execute(
+        """
+        SELECT e.user_id, e.timestamp, e.mood, e.mood_intensity, a.analysis
+        FROM journal_entries e LEFT JOIN entry_analysis a ON a.entry_id = e.id
+        """
+    ).fetchall()
+    for row in rows:
+        analysis = json.loads(row["analysis"]) if row["analysis"] else None
+        try:
+            apply_rollup(conn, row["user_id"], row["timestamp"], rollup_values(row["mood"], analysis),
+                         row["mood_intensity"], 1)
+        except ValueError:
+            continue
+
+def migrate_session_tokens(conn: sqlite3.Connection) -> None:
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(sessions)")}
+    if "token" not in columns:
+        conn.execute("ALTER TABLE sessions ADD COLUMN token TEXT")
+    rows = conn.execute("SELECT id FROM sessions WHERE token IS NULL").fetchall()
+    conn.executemany(
+        "UPDATE sessions SET token = ? WHERE id = ?",
+        [(secrets.token_urlsafe(32), row["id"]) for row in rows],
+    )
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_token ON sessions(token)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_expiry ON sessions(user_id, expiryDate)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expiry ON sessions(expiryDate)")
+
+# Applied in order by init_db(); PRAGMA user_version records how many have run.
+MIGRATIONS = [
+    migrate_entry_timestamps,
+    migrate_entry_links,
+    migrate_mood_rollups,
+    migrate_session_tokens,
+]
+
+# Entry rows with shared_to / liked_tracks assembled from the junction tables
+# in insertion order, so to_entry_dict() sees the same JSON shape as before.
+ENTRY_SELECT = """
+    SELECT id, user_id, timestamp, mood, mood_intensity, text, spotify_track_id,
+        (SELECT json_group_array(recipient_id) FROM
+            (SELECT recipient_id FROM entry_shares WHERE entry_id = journal_entries.id ORDER BY rowid)) AS shared_to,
+        (SELECT json_group_array(track_id) FROM
+            (SELECT track_id FROM entry_liked_tracks WHERE entry_id = journal_entries.id ORDER BY rowid)) AS liked_tracks
+    FROM journal_entries"""
+
+def run_migrations(conn: sqlite3.Connection) -> None:
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        step(conn)
+        conn.execute(f"PRAGMA user_version = {number}")
+
 def parse_date(date_str: str) -> datetime.date:
     return datetime.fromisoformat(date_str).date()
 
-def update_streak(user_id: str, entry_date: datetime.date) -> None:
-    with get_connection() as conn:
-        cur = conn.execute(
-            "SELECT streak_count, last_entry_date FROM users WHERE user_id = ?", (user_id,)
-        )
-        row = cur.fetchone()
-        if row:
-            streak = row["streak_count"] or 0
-            last_date_str = row["last_entry_date"]
-            last_date = parse_date(last_date_str) if last_date_str else None
-            if last_date is not None:
-                if entry_date == last_date:
-                    return
-                if entry_date == last_date + timedelta(days=1):
-                    streak += 1
-                else:
-                    streak = 1
+def update_streak(conn: sqlite3.Connection, user_id: str, entry_date: datetime.date) -> None:
+    cur = conn.execute(
+        "SELECT streak_count, last_entry_date FROM users WHERE user_id = ?", (user_id,)
+    )
+    row = cur.fetchone()
+    if row:
+        streak = row["streak_count"] or 0
+        last_date_str = row["last_entry_date"]
+        last_date = parse_date(last_date_str) if last_date_str else None
+        if last_date is not None:
+            if entry_date == last_date:
+                return
+            if entry_date == last_date + timedelta(days=1):
+                streak += 1
             else:
                 streak = 1
-            conn.execute(
-                "UPDATE users SET streak_count = ?, last_entry_date = ? WHERE user_id = ?",
-                (streak, entry_date.isoformat(), user_id),
-            )
         else:
-            conn.execute(
-                "INSERT INTO users (user_id, streak_count, last_entry_date) VALUES (?, ?, ?)",
-                (user_id, 1, entry_date.isoformat()),
-            )
+            streak = 1
+        conn.execute(
+            "UPDATE users SET streak_count = ?, last_entry_date = ? WHERE user_id = ?",
+            (streak, entry_date.isoformat(), user_id),
+        )
+    else:
+        conn.execute(
+            "INSERT INTO users (user_id, streak_count, last_entry_date) VALUES (?, ?, ?)",
+            (user_id, 1, entry_date.isoformat()),
+        )
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+def load_analysis(conn: sqlite3.Connection, entry_id: int, text: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    row = conn.execute(
+        "SELECT text_hash, analysis FROM entry_analysis WHERE entry_id = ?", (entry_id,)
+    ).fetchone()
+    if row is None or (text is not None and row["text_hash"] != text_hash(text)):
+        return None
+    return json.loads(row["analysis"])
+
+def store_analysis(conn: sqlite3.Connection, entry_id: int, text: str, analysis: Dict[str, Any]) -> None:
+    begin_write(conn)
+    entry = conn.execute("SELECT user_id, timestamp FROM journal_entries WHERE id = ?", (entry_id,)).fetchone()
+    if entry is not None:
+        previous = load_analysis(conn, entry_id)
+        apply_rollup(conn, entry["user_id"], entry["timestamp"], rollup_values(None, previous), None, -1)
+        apply_rollup(conn, entry["user_id"], entry["timestamp"], rollup_values(None, analysis), None, 1)
+    conn.execute(
+        "INSERT OR REPLACE INTO entry_analysis (entry_id, text_hash, analysis, updated_at) VALUES (?, ?, ?, ?)",
+        (entry_id, text_hash(text), json.dumps(analysis), datetime.utcnow().isoformat()),
+    )
+
+def analyze_entry(entry_id: int, text: str) -> Dict[str, Any]:
+    with get_connection() as conn:
+        analysis = load_analysis(conn, entry_id, text)
+    if analysis is not None:
+        return analysis
+    from lib.semantics import ana
+    analysis = ana(text)
+    with get_connection() as conn:
+        store_analysis(conn, entry_id, text, analysis)
         conn.commit()
+    return analysis
+
+SESSION_DAYS = 30
+
+session_cache = SessionCache()
+register_cache("session", session_cache.stats)
+session_sweeper = SessionSweeper(DATABASE_PATH)
+
+def session_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "user_id": row["user_id"],
+        "currentDate": row["currentDate"],
+        "expiryDate": row["expiryDate"],
+        "token": row["token"],
+    }
+
+def new_session(conn: sqlite3.Connection, user_id: str) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    session = {
+        "user_id": user_id,
+        "currentDate": format_ts(now),
+        "expiryDate": format_ts(now + timedelta(days=SESSION_DAYS)),
+        "token": secrets.token_urlsafe(32),
+    }
+    conn.execute(
+        "INSERT INTO sessions (user_id, currentDate, expiryDate, token) VALUES (?, ?, ?, ?)",
+        (user_id, session["currentDate"], session["expiryDate"], session["token"]),
+    )
+    return session
 
 def to_entry_dict(row: sqlite3.Row) -> Dict[str, Any]:
     shared_to = json.loads(row["shared_to"] or "[]") if "shared_to" in row.keys() else []
@@ -124,10 +404,69 @@ def to_entry_dict(row: sqlite3.Row) -> Dict[str, Any]:
 
 init_db()
 
+# Blocking work (recommendations, batch analysis) runs here instead of on the
+# event loop. ECHO_EXECUTOR=process isolates model inference in worker
+# processes; ECHO_THREADS sizes the threadpool FastAPI uses for sync routes.
+EXECUTOR_KIND = os.environ.get("ECHO_EXECUTOR", "thread")
+EXECUTOR_WORKERS = int(os.environ.get("ECHO_WORKERS", "4"))
+THREADPOOL_SIZE = int(os.environ.get("ECHO_THREADS", "40"))
+MAX_JOBS = int(os.environ.get("ECHO_MAX_JOBS", "1000"))
+MAX_PAGE_SIZE = 500
+STREAM_CHUNK = 200
+
+def make_executor() -> Executor:
+    if EXECUTOR_KIND == "process":
+        # spawn, not fork: workers start lazily, after the refresher/batcher threads
+        # and SQLite connections exist, none of which survive a fork safely.
+        return ProcessPoolExecutor(max_workers=EXECUTOR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="echo-worker")
+
+# Neither executor starts workers until the first submit, so a fresh one is
+# swapped in at shutdown and a later lifespan (tests, reload) can use it.
+executor = make_executor()
+
+jobs: Dict[str, Dict[str, Any]] = {}
+
+async def run_blocking(fn, *args):
+    loop = asyncio.get_running_loop()
+    if EXECUTOR_KIND == "process":
+        return await loop.run_in_executor(executor, fn, *args)
+    # Carry the request context into the worker so its spans reach Server-Timing.
+    return await loop.run_in_executor(executor, contextvars.copy_context().run, fn, *args)
+
+def idf_index():
+    from lib.semantics import models
+    return models.get("idf")
+
+WARM_MODELS = os.environ.get("ECHO_WARM", "1") == "1"
+
+def warm_models() -> None:
+    from lib.semantics import models
+    timings = models.warm()
+    print("models warm:", ", ".join(f"{k}={v}s" for k, v in timings.items()))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from lib.matcher import candidate_pools, MATCH_BACKEND
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    if WARM_MODELS:
+        threading.Thread(target=warm_models, name="warm-models", daemon=True).start()
+    if MATCH_BACKEND != "catalogue":
+        candidate_pools.start()
+    session_sweeper.start()
+    yield
+    session_sweeper.stop()
+    candidate_pools.stop()
+    global executor
+    executor.shutdown(wait=False, cancel_futures=True)
+    executor = make_executor()
+    close_all()
+
 app = FastAPI(
     title="EchoReal API",
     description="API for EchoReal journaling and music recommendation app.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -136,8 +475,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
+if METRICS_ENABLED:
+    @app.middleware("http")
+    async def server_timing_middleware(request: Request, call_next):
+        spans, token = start_request()
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            end_request(token)
+        total = time.perf_counter() - start
+        route = request.scope.get("route")
+        http_seconds.observe(f"{request.method} {route.path if route else 'unmatched'}", total)
+        response.headers["Server-Timing"] = server_timing(spans, total)
+        return response
+
 class JournalEntryCreate(BaseModel):
     user_id: str
     mood: str
@@ -157,14 +512,46 @@ class ShareRequest(BaseModel):
 class AttachSongRequest(BaseModel):
     track_id: str
 
+class AnalysisBatchRequest(BaseModel):
+    texts: Optional[List[str]] = None
+    entry_ids: Optional[List[int]] = None
+
+@app.get("/health")
+async def health():
+    from lib.semantics import models, emo_batcher
+    from lib.rec_cache import rec_cache
+    from lib.upstream import upstream
+    return {
+        "status": "ok",
+        "models": models.status(),
+        "emotion_batcher": emo_batcher.stats(),
+        "rec_cache": rec_cache.stats(),
+        "session_cache": session_cache.stats(),
+        "upstreams": upstream.stats(),
+    }
+
+@app.get("/metrics")
+def metrics():
+    import lib.lyrics_cache, lib.rec_cache  # register their caches before the first scrape
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/ready")
+async def health_ready():
+    from lib.semantics import models
+    status = models.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
 @app.post("/journal/entries", status_code=201)
-async def create_entry(entry: JournalEntryCreate):
+def create_entry(entry: JournalEntryCreate):
     if not entry.user_id or not entry.mood or entry.text is None:
         raise HTTPException(status_code=400, detail="user_id, mood and text are required")
     now = datetime.utcnow()
-    ts_str = now.isoformat()
+    ts_str = format_ts(now)
     shared_to_json = json.dumps([])
     liked_tracks_json = json.dumps([])
+    idf = idf_index()
     with get_connection() as conn:
         cur = conn.execute(
             """
@@ -183,28 +570,97 @@ async def create_entry(entry: JournalEntryCreate):
             ),
         )
         entry_id = cur.lastrowid
+        update_streak(conn, entry.user_id, now.date())
+        apply_rollup(conn, entry.user_id, ts_str, rollup_values(entry.mood, None), entry.mood_intensity, 1)
         conn.commit()
-    update_streak(entry.user_id, now.date())
+    idf.add(entry.text)
     return {"entry_id": entry_id, "status": "created"}
 
 @app.get("/journal/entries")
-async def list_entries(user_id: Optional[str] = Query(None)):
-    query = "SELECT * FROM journal_entries"
+def list_entries(
+    response: Response,
+    user_id: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    stream: Optional[str] = Query(None, pattern="^(ndjson|json)$"),
+):
+    where: List[str] = []
     params: List[Any] = []
     if user_id:
-        query += " WHERE user_id = ?"
+        where.append("user_id = ?")
         params.append(user_id)
-    query += " ORDER BY datetime(timestamp) DESC"
+    if cursor:
+        where.append("(timestamp, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+    clause = (" WHERE " + " AND ".join(where)) if where else ""
+    order = " ORDER BY timestamp DESC, id DESC"
+
+    query = f"{ENTRY_SELECT}{clause}{order}"
+
+    if stream:
+        # The cursor has to be in the headers before the body streams, so the
+        # page keys (index only, one extra row) are read in the same read
+        # transaction that then feeds the stream.
+        conn = connect(DATABASE_PATH)
+        conn.execute("BEGIN")
+        headers = {}
+        if limit:
+            keys = conn.execute(
+                f"SELECT timestamp, id FROM journal_entries{clause}{order} LIMIT ?", params + [limit + 1]
+            ).fetchall()
+            if len(keys) > limit:
+                headers["X-Next-Cursor"] = encode_cursor(keys[limit - 1]["timestamp"], keys[limit - 1]["id"])
+        media_type = "application/x-ndjson" if stream == "ndjson" else "application/json"
+        query += f" LIMIT {limit}" if limit else ""
+        return StreamingResponse(stream_entries(conn, query, params, stream), media_type=media_type, headers=headers)
+    # One extra row tells whether there is a next page, from the same read.
     with get_connection() as conn:
-        cur = conn.execute(query, params)
-        rows = cur.fetchall()
+        rows = conn.execute(query + (f" LIMIT {limit + 1}" if limit else ""), params).fetchall()
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
     entries = [to_entry_dict(row) for row in rows]
     return entries
 
+def encode_cursor(timestamp: str, entry_id: int) -> str:
+    raw = json.dumps([timestamp, entry_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, entry_id = json.loads(raw)
+        return [str(timestamp), int(entry_id)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def stream_entries(conn: sqlite3.Connection, query: str, params: List[Any], fmt: str) -> Iterator[str]:
+    # Starlette may advance this generator from different threads, so it
+    # reads through its own connection (opened by the caller inside a read
+    # transaction) rather than the per-thread one; it is closed here.
+    try:
+        cur = conn.execute(query, params)
+        first = True
+        if fmt == "json":
+            yield "["
+        while True:
+            rows = cur.fetchmany(STREAM_CHUNK)
+            if not rows:
+                break
+            if fmt == "ndjson":
+                yield "".join(json.dumps(to_entry_dict(row)) + "\n" for row in rows)
+            else:
+                yield ("" if first else ",") + ",".join(json.dumps(to_entry_dict(row)) for row in rows)
+                first = False
+        if fmt == "json":
+            yield "]"
+    finally:
+        conn.close()
+
 @app.get("/journal/entries/{entry_id}")
-async def get_entry(entry_id: int):
+def get_entry(entry_id: int):
     with get_connection() as conn:
-        cur = conn.execute("SELECT * FROM journal_entries WHERE id = ?", (entry_id,))
+        cur = conn.execute(f"{ENTRY_SELECT} WHERE id = ?", (entry_id,))
         row = cur.fetchone()
     if row is None:
         raise HTTPException(status_code=404, detail="Entry not found")
@@ -212,31 +668,69 @@ async def get_entry(entry_id: int):
 
 @app.patch("/journal/entries/{entry_id}")
 @app.put("/journal/entries/{entry_id}")
-async def update_entry(entry_id: int, entry: JournalEntryUpdate):
+def update_entry(entry_id: int, entry: JournalEntryUpdate):
     allowed = {"mood", "mood_intensity", "text"}
     updates = {k: v for k, v in entry.dict(exclude_unset=True).items() if k in allowed}
     if not updates:
         raise HTTPException(status_code=400, detail="No updatable fields provided")
     sets = ", ".join(f"{k} = ?" for k in updates.keys())
     params = list(updates.values()) + [entry_id]
+    idf = idf_index() if "text" in updates else None
     with get_connection() as conn:
+        begin_write(conn)
+        old = conn.execute("SELECT * FROM journal_entries WHERE id = ?", (entry_id,)).fetchone()
         cur = conn.execute(f"UPDATE journal_entries SET {sets} WHERE id = ?", params)
         if cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="Entry not found")
+        analysis = load_analysis(conn, entry_id)
+        apply_rollup(conn, old["user_id"], old["timestamp"], rollup_values(old["mood"], analysis),
+                     old["mood_intensity"], -1)
+        if "text" in updates and old["text"] != updates["text"]:
+            conn.execute("DELETE FROM entry_analysis WHERE entry_id = ?", (entry_id,))
+            analysis = None
+        new = conn.execute("SELECT * FROM journal_entries WHERE id = ?", (entry_id,)).fetchone()
+        apply_rollup(conn, new["user_id"], new["timestamp"], rollup_values(new["mood"], analysis),
+                     new["mood_intensity"], 1)
         conn.commit()
+    if idf is not None:
+        idf.replace(old["text"], updates["text"])
+    from lib.rec_cache import rec_cache
+    rec_cache.invalidate_entry(entry_id)
     return {"status": "updated"}
 
 @app.delete("/journal/entries/{entry_id}")
-async def delete_entry(entry_id: int):
+def delete_entry(entry_id: int):
+    idf = idf_index()
     with get_connection() as conn:
+        begin_write(conn)
+        old = conn.execute("SELECT * FROM journal_entries WHERE id = ?", (entry_id,)).fetchone()
         cur = conn.execute("DELETE FROM journal_entries WHERE id = ?", (entry_id,))
         if cur.rowcount == 0:
             raise HTTPException(status_code=404, detail="Entry not found")
+        apply_rollup(conn, old["user_id"], old["timestamp"], rollup_values(old["mood"], load_analysis(conn, entry_id)),
+                     old["mood_intensity"], -1)
+        conn.execute("DELETE FROM entry_analysis WHERE entry_id = ?", (entry_id,))
+        conn.execute("DELETE FROM entry_shares WHERE entry_id = ?", (entry_id,))
+        conn.execute("DELETE FROM entry_liked_tracks WHERE entry_id = ?", (entry_id,))
         conn.commit()
+    idf.remove(old["text"])
+    from lib.rec_cache import rec_cache
+    rec_cache.invalidate_entry(entry_id)
     return {"status": "deleted"}
 
+@app.get("/journal/entries/{entry_id}/analysis")
+def get_entry_analysis(entry_id: int):
+    with get_connection() as conn:
+        row = conn.execute("SELECT text FROM journal_entries WHERE id = ?", (entry_id,)).fetchone()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Entry not found")
+        analysis = load_analysis(conn, entry_id, row["text"])
+    if analysis is None:
+        raise HTTPException(status_code=404, detail="Analysis not computed")
+    return {"entry_id": entry_id, "analysis": analysis}
+
 @app.post("/journal/entries/{entry_id}/attach-song")
-async def attach_song(entry_id: int, req: AttachSongRequest):
+def attach_song(entry_id: int, req: AttachSongRequest):
     if not req.track_id:
         raise HTTPException(status_code=400, detail="track_id is required")
     with get_connection() as conn:
@@ -250,7 +744,7 @@ async def attach_song(entry_id: int, req: AttachSongRequest):
     return {"status": "attached"}
 
 @app.get("/journal/entries/user-latest/{user_id}")
-async def get_song(user_id: str):
+def get_song(user_id: str):
     now = datetime.utcnow()
     ts_str = now.isoformat()
 
@@ -258,7 +752,7 @@ async def get_song(user_id: str):
         raise HTTPException(status_code=400, detail="user_id is required")
     with get_connection() as conn:
         print(ts_str)
-        cur = conn.execute("SELECT * FROM journal_entries WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
+        cur = conn.execute(f"{ENTRY_SELECT} WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT 1", (user_id,))
         row = cur.fetchone()
     
     if row is None:
@@ -290,29 +784,80 @@ async def recommendations():
     return {"songs": songs}
 
 @app.post("/share")
-async def share(req: ShareRequest):
+def share(req: ShareRequest):
     entry_id = req.entry_id
     recipients = req.recipients
     if not entry_id or not recipients:
         raise HTTPException(status_code=400, detail="entry_id and recipients are required")
+    shared_at = format_ts(datetime.utcnow())
     with get_connection() as conn:
-        cur = conn.execute("SELECT shared_to FROM journal_entries WHERE id = ?", (entry_id,))
-        row = cur.fetchone()
-        if row is None:
+        cur = conn.execute("SELECT 1 FROM journal_entries WHERE id = ?", (entry_id,))
+        if cur.fetchone() is None:
             raise HTTPException(status_code=404, detail="Entry not found")
-        current_recipients = json.loads(row["shared_to"] or "[]")
-        for r in recipients:
-            if r not in current_recipients:
-                current_recipients.append(r)
-        conn.execute(
-            "UPDATE journal_entries SET shared_to = ? WHERE id = ?",
-            (json.dumps(current_recipients), entry_id),
+        conn.executemany(
+            "INSERT OR IGNORE INTO entry_shares (entry_id, recipient_id, shared_at) VALUES (?, ?, ?)",
+            [(entry_id, r, shared_at) for r in dict.fromkeys(recipients)],
         )
         conn.commit()
     return {"status": "shared"}
 
+@app.get("/users/{user_id}/mood-timeline")
+def mood_timeline(
+    user_id: str,
+    period: str = Query("day", pattern="^(day|week)$"),
+    start: Optional[str] = Query(None),
+    end: Optional[str] = Query(None),
+):
+    try:
+        start_day = parse_date(start) if start else None
+        end_day = parse_date(end) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be ISO dates")
+    if period == "week" and start_day is not None:
+        start_day -= timedelta(days=start_day.weekday())
+    query = "SELECT bucket, dimension, value, entries, intensity_sum, intensity_count FROM mood_rollups WHERE user_id = ? AND period = ?"
+    params: List[Any] = [user_id, period]
+    if start_day is not None:
+        query += " AND bucket >= ?"
+        params.append(start_day.isoformat())
+    if end_day is not None:
+        query += " AND bucket <= ?"
+        params.append(end_day.isoformat())
+    with get_connection() as conn:
+        rows = conn.execute(query + " ORDER BY bucket", params).fetchall()
+
+    buckets: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        point = buckets.setdefault(row["bucket"], {
+            "bucket": row["bucket"], "entries": 0, "avg_intensity": None,
+            "mood": {}, "sentiment": {}, "emotion": {}, "_isum": 0, "_icount": 0,
+        })
+        point[row["dimension"]][row["value"]] = row["entries"]
+        if row["dimension"] == "mood":
+            point["entries"] += row["entries"]
+            point["_isum"] += row["intensity_sum"]
+            point["_icount"] += row["intensity_count"]
+    timeline = []
+    for point in buckets.values():
+        isum, icount = point.pop("_isum"), point.pop("_icount")
+        if icount:
+            point["avg_intensity"] = round(isum / icount, 2)
+        timeline.append(point)
+    return {"user_id": user_id, "period": period, "timeline": timeline}
+
+@app.get("/users/{user_id}/shared-with-me")
+def list_shared_with(user_id: str):
+    with get_connection() as conn:
+        cur = conn.execute(
+            f"{ENTRY_SELECT} WHERE id IN (SELECT entry_id FROM entry_shares WHERE recipient_id = ?)"
+            " ORDER BY timestamp DESC, id DESC",
+            (user_id,),
+        )
+        rows = cur.fetchall()
+    return [to_entry_dict(row) for row in rows]
+
 @app.get("/users/{user_id}/streak")
-async def get_streak(user_id: str):
+def get_streak(user_id: str):
     with get_connection() as conn:
         cur = conn.execute("SELECT streak_count FROM users WHERE user_id = ?", (user_id,))
         row = cur.fetchone()
@@ -320,7 +865,7 @@ async def get_streak(user_id: str):
     return {"streak_count": streak}
 
 @app.get("/users")
-async def list_users():
+def list_users():
     with get_connection() as conn:
         cur = conn.execute("SELECT * FROM users ")
         cur_rows = cur.fetchall()
@@ -334,7 +879,7 @@ async def list_users():
     return {"result": users}
 
 @app.post("/users/{user_id}", status_code=201)
-async def create_user(user_id: str):
+def create_user(user_id: str):
     with get_connection() as conn:
         cur = conn.execute(
             "INSERT OR IGNORE INTO users (user_id, streak_count, last_entry_date) VALUES (?, 0, NULL)",
@@ -346,7 +891,7 @@ async def create_user(user_id: str):
     return {"status": "created"}
 
 @app.get("/users/get/{user_id}")
-async def get_user_byid(user_id: str):
+def get_user_byid(user_id: str):
     with get_connection() as conn:
         cur = conn.execute(
             "SELECT * FROM users WHERE user_id = ?", (user_id,)
@@ -361,66 +906,137 @@ async def get_user_byid(user_id: str):
     }
     return {"res": user_data}
 
-@app.get("/genius/generate")
-async def genius_generate(user_id: str = Query(...)):
-    if not user_id:
-        raise HTTPException(status_code=400, detail="user_id is required")
-    global text
+class RecommendationError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def recommend(user_id: str) -> Dict[str, Any]:
     with get_connection() as conn:
-        cur = conn.execute("SELECT * FROM journal_entries WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
+        cur = conn.execute("SELECT * FROM journal_entries WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT 1", (user_id,))
         row = cur.fetchone()
     if row is None:
-        raise HTTPException(status_code=404, detail="Entry not found")
+        raise RecommendationError(404, "Entry not found")
     text = row["text"]
     if not text:
-        raise HTTPException(status_code=400, detail="No text found in entry")
-    from lib.matcher import match
-    from lib.semantics import ana
-    result = match(text, ana)
+        raise RecommendationError(400, "No text found in entry")
+    from lib.matcher import match, MATCH_BACKEND, SCORER_VERSION
+    from lib.rec_cache import rec_cache, rec_key
+    analysis = analyze_entry(row["id"], text)
+    key = rec_key(text, analysis, f"{SCORER_VERSION}:{MATCH_BACKEND}")
+    result = rec_cache.get(key)
+    if result is None:
+        result = match(text, lambda _: analysis)
+        if isinstance(result, list):
+            rec_cache.put(key, row["id"], result)
     return {"result": result}
 
-@app.get("/session/create/{user_id}", status_code=201)
-async def create_session(user_id: str):
+@app.get("/genius/generate")
+async def genius_generate(user_id: str = Query(...)):
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id is required")
+    try:
+        return await run_blocking(recommend, user_id)
+    except RecommendationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@app.post("/genius/jobs", status_code=202)
+async def create_recommendation_job(user_id: str = Query(...)):
+    if not user_id:
+        raise HTTPException(status_code=400, detail="user_id is required")
+    if len(jobs) >= MAX_JOBS:
+        # Drop finished jobs, oldest first; running ones are still being polled.
+        for old_id in [j for j, job in jobs.items() if job["future"].done()][:len(jobs) - MAX_JOBS + 1]:
+            del jobs[old_id]
+        if len(jobs) >= MAX_JOBS:
+            raise HTTPException(status_code=503, detail="Too many pending jobs", headers={"Retry-After": "5"})
+    job_id = uuid.uuid4().hex
+    jobs[job_id] = {
+        "user_id": user_id,
+        "created_at": datetime.utcnow().isoformat(),
+        "future": executor.submit(recommend, user_id),
+    }
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/genius/jobs/{job_id}")
+async def get_recommendation_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    fut = job["future"]
+    info = {"job_id": job_id, "user_id": job["user_id"], "created_at": job["created_at"]}
+    if not fut.done():
+        return {**info, "status": "running" if fut.running() else "queued"}
+    err = fut.exception()
+    if isinstance(err, RecommendationError):
+        return {**info, "status": "failed", "error": {"status_code": err.status_code, "detail": err.detail}}
+    if err is not None:
+        return {**info, "status": "failed", "error": {"status_code": 500, "detail": str(err)}}
+    return {**info, "status": "done", **fut.result()}
+
+@app.post("/analysis/batch")
+async def analysis_batch(req: AnalysisBatchRequest):
+    if not req.texts and not req.entry_ids:
+        raise HTTPException(status_code=400, detail="texts or entry_ids are required")
+    return await run_blocking(analyze_batch, req.texts, req.entry_ids)
+
+def analyze_batch(texts: Optional[List[str]], entry_ids: Optional[List[int]]) -> Dict[str, Any]:
+    from lib.semantics import ana_batch
+    if texts:
+        return {"results": ana_batch(texts)}
     with get_connection() as conn:
         cur = conn.execute(
-            "SELECT * from sessions where user_id = ?", (user_id,))
-        existing_session = cur.fetchone()
+            "SELECT id, text FROM journal_entries WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id",
+            (json.dumps(entry_ids),),
+        )
+        rows = cur.fetchall()
+    results = ana_batch([row["text"] or "" for row in rows])
     with get_connection() as conn:
-        cur = conn.execute(
-            "INSERT INTO sessions (user_id, currentDate, expiryDate) VALUES (?,?,?)", (user_id, datetime.utcnow().isoformat(), (datetime.utcnow() + timedelta(days=30)).isoformat()))
+        for row, res in zip(rows, results):
+            store_analysis(conn, row["id"], row["text"] or "", res)
         conn.commit()
-    return {"status": "session created", "session": {
-        "user_id": user_id,
-        "currentDate": datetime.utcnow().isoformat(),
-        "expiryDate": (datetime.utcnow() + timedelta(days=30)).isoformat()
-    }}
+    return {"results": [{"entry_id": row["id"], **res} for row, res in zip(rows, results)]}
 
-@app.get("/session/validate/{user_id}")
-async def validate_session(user_id: str):
+@app.get("/session/create/{user_id}", status_code=201)
+def create_session(user_id: str):
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id is required")
     with get_connection() as conn:
-        cur = conn.execute(
-            "SELECT * from sessions where user_id = ?", (user_id,))
-        session = cur.fetchone()
-    if not session:
+        session = new_session(conn, user_id)
+        conn.commit()
+    session_cache.put(session)
+    return {"status": "session created", "session": session}
+
+@app.get("/session/validate/{user_id}")
+def validate_session(user_id: str, token: Optional[str] = Query(None)):
+    if not user_id:
+        raise HTTPException(status_code=400, detail="user_id is required")
+    key = ("token", token) if token else ("user", user_id)
+    session = session_cache.get(key)
+    if session is None:
+        with get_connection() as conn:
+            if token:
+                cur = conn.execute("SELECT * FROM sessions WHERE token = ?", (token,))
+            else:
+                cur = conn.execute(
+                    "SELECT * FROM sessions WHERE user_id = ? ORDER BY expiryDate DESC LIMIT 1", (user_id,))
+            row = cur.fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Session not found")
+        session = session_dict(row)
+        if session["expiryDate"] < datetime.utcnow().isoformat():
+            raise HTTPException(status_code=403, detail="Session expired")
+        session_cache.put(session)
+    if session["user_id"] != user_id:
         raise HTTPException(status_code=404, detail="Session not found")
-    current_date = datetime.utcnow()
-    expiry_date = datetime.fromisoformat(session["expiryDate"])
-    if current_date > expiry_date:
-        raise HTTPException(status_code=403, detail="Session expired")
-    return {"status": "session valid", "session": {
-        "user_id": session["user_id"],
-        "currentDate": session["currentDate"],
-        "expiryDate": session["expiryDate"]
-    }}
+    return {"status": "session valid", "session": session}
 
 @app.get("/session/delete/{user_id}")
-async def delete_session(user_id: str):
+def delete_session(user_id: str):
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id is required")
+    session_cache.drop_user(user_id)
     with get_connection() as conn:
         cur = conn.execute(
             "DELETE FROM sessions WHERE user_id = ?", (user_id,))
@@ -430,8 +1046,7 @@ async def delete_session(user_id: str):
     return {"status": "session deleted"}
 
 @app.post("/auth/register", status_code=201)
-async def register_user(request: Request):
-    data = await request.json()
+def register_user(data: Dict[str, Any] = Body(...)):
     user_id = data.get("user_id")
     email = data.get("email")
     password = data.get("password")
@@ -445,31 +1060,18 @@ async def register_user(request: Request):
                 "INSERT INTO auth_data (user_id, email, password) VALUES (?, ?, ?)",
                 (user_id, email, password)
             )
+            session_info = new_session(conn, user_id)
             conn.commit()
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=409, detail="User ID or email already exists")
-
-    current_date = datetime.utcnow().isoformat()
-    expiry_date = (datetime.utcnow() + timedelta(days=30)).isoformat()
-    with get_connection() as conn:
-        conn.execute(
-            "INSERT INTO sessions (user_id, currentDate, expiryDate) VALUES (?, ?, ?)",
-            (user_id, current_date, expiry_date)
-        )
-        conn.commit()
-
-    session_info = {
-        "user_id": user_id,
-        "currentDate": current_date,
-        "expiryDate": expiry_date
-    }
+    session_cache.put(session_info)
 
     return {"status": "registered", "user_id": user_id, "session": session_info}
 
 
 
 @app.post("/auth/login")
-async def login_user(payload: LoginRequest, response: Response):
+def login_user(payload: LoginRequest, response: Response):
     user_id = payload.user_id
     email = payload.email
     password = payload.password
@@ -480,48 +1082,38 @@ async def login_user(payload: LoginRequest, response: Response):
         raise HTTPException(status_code=400, detail="email or user_id is required")
 
     user = None
-    if email:
-        with get_connection() as conn:
+    with get_connection() as conn:
+        if email:
             cur = conn.execute(
                 "SELECT * FROM auth_data WHERE email = ? AND password = ?",
                 (email, password)
             )
             user = cur.fetchone()
 
-    if user is None and user_id:
-        with get_connection() as conn:
+        if user is None and user_id:
             cur = conn.execute(
                 "SELECT * FROM auth_data WHERE user_id = ? AND password = ?",
                 (user_id, password)
             )
             user = cur.fetchone()
 
-    if user is None:
-        raise HTTPException(status_code=401, detail="Invalid credentials")
-    
-    actual_user_id = user["user_id"]
-    current_date = datetime.utcnow().isoformat()
-    expiry_date = (datetime.utcnow() + timedelta(days=30)).isoformat()
-    with get_connection() as conn:
-        cur = conn.execute(
-            "INSERT INTO sessions (user_id, currentDate, expiryDate) VALUES (?, ?, ?)",
-            (actual_user_id, current_date, expiry_date)
-        )
+        if user is None:
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+
+        actual_user_id = user["user_id"]
+        session_info = new_session(conn, actual_user_id)
         conn.commit()
-    session_info = {
-        "user_id": actual_user_id,
-        "currentDate": current_date,
-        "expiryDate": expiry_date
-    }
+    session_cache.put(session_info)
 
     response.set_cookie(key="user_id", value=session_info["user_id"], path="/")
     response.set_cookie(key="currentDate", value=session_info["currentDate"], path="/")
     response.set_cookie(key="expiryDate", value=session_info["expiryDate"], path="/")
+    response.set_cookie(key="session_token", value=session_info["token"], path="/", httponly=True)
 
     return {"status": "logged in", "user_id": actual_user_id, "session": session_info}
 
 @app.get('/auth/user/{user_id}')
-async def get_auth_user(user_id: str):
+def get_auth_user(user_id: str):
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id is required")
     with get_connection() as conn:
@@ -534,7 +1126,7 @@ async def get_auth_user(user_id: str):
         "email": user["email"]
     }
 @app.delete('/auth/user/{user_id}')
-async def delete_auth_user(user_id: str):
+def delete_auth_user(user_id: str):
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id is required")
     with get_connection() as conn:
@@ -0,0 +1,45 @@
+"""Compare two bench/run.py result files metric by metric.
+
+Run from backend/:  python -m bench.compare OLD.json NEW.json [--metric p95_ms]
+"""
+import argparse
+import json
+
+
+def flatten(obj, prefix=""):
+    """Yield (path, summary) for every latency summary (a dict with p50_ms) in a result tree."""
+    if isinstance(obj, dict):
+        if "p50_ms" in obj:
+            label = prefix + (f"@c{obj['concurrency']}" if "concurrency" in obj else "")
+            yield label, obj
+            return
+        for k, v in obj.items():
+            yield from flatten(v, f"{prefix}.{k}" if prefix else k)
+    elif isinstance(obj, list):
+        for v in obj:
+            yield from flatten(v, prefix)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--metric", default="p50_ms", choices=["mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms", "rps"])
+    args = parser.parse_args(argv)
+    with open(args.old) as f:
+        old = dict(flatten(json.load(f)))
+    with open(args.new) as f:
+        new = dict(flatten(json.load(f)))
+
+    width = max((len(k) for k in new), default=10)
+    print(f"{'metric':<{width}}  {'old':>10}  {'new':>10}  {'change':>8}")
+    for key, summary in new.items():
+        if key not in old or args.metric not in summary or args.metric not in old[key]:
+            continue
+        a, b = old[key][args.metric], summary[args.metric]
+        change = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+        print(f"{key:<{width}}  {a:>10.2f}  {b:>10.2f}  {change:>8}")
+
+
+if __name__ == "__main__":
+    main()
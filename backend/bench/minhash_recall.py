@@ -0,0 +1,122 @@
+"""Recall of the MinHash/LSH shortlist against exact journal/lyric Jaccard.
+
+Run from backend/:  python -m bench.minhash_recall [--bands 20 32 48] [--rows 1] [--db echo.db] [--out results.json]
+
+Queries are journal entries from the app database (opened read-only) when there are any,
+otherwise word samples drawn from catalogue lyrics. Ground truth is the
+exact Jaccard of every query against every catalogue track (one sparse
+mat-vec per query); each bands/rows setting is built in a scratch
+directory and compared at the same threshold.
+"""
+import argparse
+import json
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from lib.catalogue import Catalogue
+from lib.db import DB_PATH
+from lib.lyrics_cache import lyric_words
+from lib.minhash import MINHASH_PERM, MINHASH_THRESHOLD, MinHashIndex
+from lib.scoring import TermMatrix
+
+
+def load_queries(n, docs, seed, db=DB_PATH):
+    rng = random.Random(seed)
+    try:
+        # Read-only: lib.db.connect() would switch the app database to WAL.
+        conn = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+        try:
+            texts = [row[0] for row in conn.execute("SELECT text FROM journal_entries WHERE text != ''")]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        texts = []
+    if texts:
+        queries = [lyric_words(t) for t in rng.sample(texts, min(n, len(texts)))]
+        return [q for q in queries if q]
+    queries = []
+    for _ in range(n):
+        words = sorted(docs[rng.randrange(len(docs))][1])
+        if words:
+            queries.append(set(rng.sample(words, min(len(words), rng.randint(10, 40)))))
+    return queries
+
+
+def evaluate(docs, queries, terms, num_perm, bands, rows, threshold):
+    ids = np.array([d[0] for d in docs], dtype=np.int64)
+    with tempfile.TemporaryDirectory() as tmp:
+        index = MinHashIndex(tmp)
+        t0 = time.perf_counter()
+        index.build(docs, num_perm, bands, rows)
+        build_s = time.perf_counter() - t0
+
+        relevant = found_lsh = found_short = 0
+        cand_sizes, short_sizes, approx_ms, exact_ms = [], [], [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            common = terms.overlap(q)
+            jaccard = common / np.maximum(len(q) + terms.sizes - common, 1)
+            truth = set(ids[jaccard >= threshold].tolist())
+            exact_ms.append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            shortlist, _ = index.query(q, threshold)
+            approx_ms.append((time.perf_counter() - t0) * 1000)
+            cand, _ = index.candidates(q)
+
+            relevant += len(truth)
+            found_lsh += len(truth & set(index.ids[cand].tolist()))
+            found_short += len(truth & set(shortlist.tolist()))
+            cand_sizes.append(len(cand))
+            short_sizes.append(len(shortlist))
+    return {
+        "num_perm": num_perm,
+        "bands": bands,
+        "rows": rows,
+        "midpoint": round((1 / bands) ** (1 / rows), 4),
+        "threshold": threshold,
+        "build_s": round(build_s, 3),
+        "relevant": relevant,
+        "recall_lsh": round(found_lsh / relevant, 4) if relevant else None,
+        "recall_shortlist": round(found_short / relevant, 4) if relevant else None,
+        "candidate_fraction": round(float(np.mean(cand_sizes)) / len(docs), 4),
+        "avg_shortlist": round(float(np.mean(short_sizes)), 1),
+        "approx_ms": round(float(np.median(approx_ms)), 3),
+        "exact_ms": round(float(np.median(exact_ms)), 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--perm", type=int, default=MINHASH_PERM)
+    parser.add_argument("--bands", type=int, nargs="+", default=[20, 32, 48])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1])
+    parser.add_argument("--threshold", type=float, default=MINHASH_THRESHOLD)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", default=DB_PATH, help="app database to sample journal entries from")
+    parser.add_argument("--out", help="also write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    docs = [(row["id"], set((row["words"] or "").split())) for row in Catalogue().iter_lyrics()]
+    if not docs:
+        sys.exit("catalogue has no lyrics; run `python -m lib.catalogue ingest` first")
+    queries = load_queries(args.queries, docs, args.seed, args.db)
+    terms = TermMatrix.from_sets([words for _, words in docs])
+
+    results = [evaluate(docs, queries, terms, args.perm, b, r, args.threshold)
+               for r in args.rows for b in args.bands if b * r <= args.perm]
+    report = {"tracks": len(docs), "queries": len(queries), "results": results}
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
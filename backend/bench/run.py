@@ -0,0 +1,297 @@
+"""Offline benchmark suite: ana stages, match() latency/throughput, API load.
+
+Run from backend/:
+
+    python -m bench.run [--stages ana match api] [--concurrency 1 8 32]
+                        [--latency 50 --jitter 10 --error-rate 0.01] [--out results.json]
+
+Spotify and Genius are replaced by bench/stub_server.py serving
+bench/fixtures, and every store (app DB, lyrics cache, pools, catalogue)
+lives in a scratch directory, so runs are repeatable and never touch the
+real database or APIs. --canned-analysis swaps model inference for a
+fixed analysis per entry, isolating matcher, HTTP and SQLite cost.
+Results are written as JSON; compare two runs with `python -m bench.compare`.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bench.stub_server import FIXTURES, Fixtures, StubServer
+
+ENTRIES = os.path.join(os.path.dirname(__file__), "fixtures", "entries.txt")
+EMOTIONS = ["joy", "sadness", "anger", "love", "fear", "surprise"]
+SENTIMENTS = ["positive", "negative", "neutral"]
+
+
+def summarize(samples_ms):
+    if not samples_ms:
+        return {"n": 0}
+    a = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "n": len(a),
+        "mean_ms": round(float(a.mean()), 3),
+        "p50_ms": round(float(np.percentile(a, 50)), 3),
+        "p95_ms": round(float(np.percentile(a, 95)), 3),
+        "p99_ms": round(float(np.percentile(a, 99)), 3),
+        "max_ms": round(float(a.max()), 3),
+    }
+
+
+def timed(samples, fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    samples.append((time.perf_counter() - start) * 1000)
+    return out
+
+
+def load(fn, n, concurrency):
+    """Call fn(i) for i in range(n) from `concurrency` threads; latency summary, rps and outcomes."""
+    samples, outcomes, lock = [], {}, threading.Lock()
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            outcome = fn(i)
+        except Exception as e:
+            outcome = type(e).__name__
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            samples.append(elapsed)
+            outcomes[str(outcome)] = outcomes.get(str(outcome), 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(n)))
+    wall = time.perf_counter() - start
+    return {"concurrency": concurrency, "rps": round(n / wall, 2), **summarize(samples), "outcomes": outcomes}
+
+
+def configure_env(tmp, stub_url):
+    """Point every store and upstream at scratch/stub locations; must run before lib imports."""
+    os.environ.update({
+        "ECHO_DB": os.path.join(tmp, "echo.db"),
+        "ECHO_POOLS": os.path.join(tmp, "pools.json"),
+        "ECHO_CATALOGUE": os.path.join(tmp, "catalogue.db"),
+        "ECHO_EMBEDDINGS": os.path.join(tmp, "embeddings"),
+        "ECHO_MINHASH": os.path.join(tmp, "minhash"),
+        "POOL_REFRESH": "0",
+        "REC_TTL": "3600",
+        "ECHO_WARM": "0",
+        "MATCH_BACKEND": "live",
+        "SPOTIFY_API": stub_url,
+        "SPOTIFY_ACCOUNTS": stub_url,
+        "GENIUS_API": stub_url,
+        "SPOT_ID": "bench",
+        "SPOT_SEC": "bench",
+        "GENIUS_KEY": "bench",
+        # The stub serves Spotify and both Genius hosts from one address, so a
+        # per-host limit would throttle all three together; measure app cost.
+        "HTTP_RATE": "0",
+    })
+
+
+def canned_analysis(text, i):
+    from lib.lyrics_cache import WORD_RE
+    words = WORD_RE.findall(text.lower())
+    return {
+        "tokens": words,
+        "keywords": words[:5],
+        "sentiment": SENTIMENTS[i % len(SENTIMENTS)],
+        "emotion": EMOTIONS[i % len(EMOTIONS)],
+        "scores": {},
+    }
+
+
+def bench_ana(texts, repeat):
+    from lib import semantics
+    try:
+        load_s = semantics.models.warm()
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {' '.join(str(e).split())[:200]}"}
+    stages = {name: [] for name in ("clean", "process", "key", "sent", "emo", "ana")}
+    for _ in range(repeat):
+        for txt in texts:
+            cleaned = timed(stages["clean"], semantics.clean, txt)
+            timed(stages["process"], semantics.process, cleaned)
+            timed(stages["key"], semantics.key, cleaned)
+            timed(stages["sent"], semantics.sent_scored, cleaned)
+            timed(stages["emo"], semantics.emo, cleaned)
+            timed(stages["ana"], semantics.ana, txt)
+    return {"load_s": load_s, "stages": {name: summarize(s) for name, s in stages.items()}}
+
+
+def analyses_for(texts, canned):
+    if canned:
+        return {txt: canned_analysis(txt, i) for i, txt in enumerate(texts)}
+    from lib.semantics import ana
+    return {txt: ana(txt) for txt in texts}
+
+
+def bench_match(texts, analyses, n, concurrency):
+    from lib import matcher
+    from lib.lyrics_cache import lyrics_cache
+
+    def run(txt):
+        result = matcher.match(txt, lambda _: analyses[txt])
+        return "ok" if isinstance(result, list) else result
+
+    cold, outcomes = [], {}
+    for txt in texts:
+        matcher.candidate_pools.clear()
+        matcher.spot_tokens.invalidate()
+        lyrics_cache.clear()
+        outcome = timed(cold, run, txt)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    for txt in texts:
+        run(txt)
+    warm = []
+    for txt in texts:
+        timed(warm, run, txt)
+    return {
+        "cold": {**summarize(cold), "outcomes": outcomes},
+        "warm": summarize(warm),
+        "throughput": [load(lambda i: run(texts[i % len(texts)]), n, c) for c in concurrency],
+        "lyrics_cache": lyrics_cache.stats(),
+        "token_refreshes": matcher.spot_tokens.refreshes,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_api(texts, analyses, canned, n, concurrency, users):
+    import requests
+    import uvicorn
+    import app as app_module
+
+    if canned:
+        app_module.analyze_entry = lambda entry_id, text: analyses.get(text) or canned_analysis(text, entry_id)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-api", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    base = f"http://127.0.0.1:{port}"
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, "s"):
+            local.s = requests.Session()
+        return local.s
+
+    user_ids = [f"bench-user-{u}" for u in range(users)]
+    for u, uid in enumerate(user_ids):
+        session().post(f"{base}/users/{uid}")
+        for j in range(3):
+            session().post(f"{base}/journal/entries", json={
+                "user_id": uid, "mood": EMOTIONS[(u + j) % len(EMOTIONS)],
+                "text": texts[(u * 3 + j) % len(texts)], "mood_intensity": 5,
+            })
+
+    def get(path):
+        return lambda i: session().get(base + path.format(user=user_ids[i % users])).status_code
+
+    def post_entry(i):
+        return session().post(f"{base}/journal/entries", json={
+            "user_id": user_ids[i % users], "mood": EMOTIONS[i % len(EMOTIONS)],
+            "text": texts[i % len(texts)], "mood_intensity": 5,
+        }).status_code
+
+    scenarios = {
+        "health": get("/health"),
+        "list_entries": get("/journal/entries?user_id={user}&limit=50"),
+        "mood_timeline": get("/users/{user}/mood-timeline"),
+        "create_entry": post_entry,
+        "genius_generate": get("/genius/generate?user_id={user}"),
+    }
+    try:
+        return {name: [load(fn, n, c) for c in concurrency] for name, fn in scenarios.items()}
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+def git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for EchoReal.")
+    parser.add_argument("--stages", nargs="+", choices=["ana", "match", "api"], default=["ana", "match", "api"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per load-test level")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the entries for ana timings")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--fixtures", nargs="+", default=[FIXTURES])
+    parser.add_argument("--entries", default=ENTRIES)
+    parser.add_argument("--latency", type=float, default=0, help="stub latency per upstream call, ms")
+    parser.add_argument("--jitter", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--canned-analysis", action="store_true",
+                        help="skip model inference in match/api stages (ana stage still runs if selected)")
+    parser.add_argument("--out", help="results file (default bench/results/run-<time>.json)")
+    args = parser.parse_args(argv)
+
+    with open(args.entries) as f:
+        texts = [line.strip() for line in f if line.strip()]
+    port = free_port()
+    tmp = tempfile.mkdtemp(prefix="echo-bench-")
+    configure_env(tmp, f"http://127.0.0.1:{port}")
+    stub = StubServer(Fixtures(args.fixtures), port=port, latency=args.latency, jitter=args.jitter,
+                      error_rate=args.error_rate).start()
+
+    results = {
+        "meta": {
+            "git": git_rev(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k != "out"},
+            "entries": len(texts),
+            "fixture_tracks": len(stub.fixtures.tracks),
+        },
+    }
+    if "ana" in args.stages:
+        results["ana"] = bench_ana(texts, args.repeat)
+        print("ana done", file=sys.stderr)
+    analyses = None
+    if {"match", "api"} & set(args.stages):
+        canned = args.canned_analysis or "error" in results.get("ana", {})
+        results["meta"]["analysis"] = "canned" if canned else "models"
+        analyses = analyses_for(texts, canned)
+    if "match" in args.stages:
+        results["match"] = bench_match(texts, analyses, args.requests, args.concurrency)
+        print("match done", file=sys.stderr)
+    if "api" in args.stages:
+        results["api"] = bench_api(texts, analyses, results["meta"]["analysis"] == "canned",
+                                   args.requests, args.concurrency, args.users)
+        print("api done", file=sys.stderr)
+    results["stub"] = stub.counts
+    stub.stop()
+
+    out = args.out or os.path.join(os.path.dirname(__file__), "results", time.strftime("run-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Local stand-in for the Spotify and Genius endpoints lib.matcher calls.
+
+Run from backend/:  python -m bench.stub_server [--port 8900] [--latency 80 --jitter 20 --error-rate 0.02]
+
+Serves POST /api/token, GET /v1/search, GET /search (Genius) and lyric pages
+at GET /lyrics/<id> from recorded fixtures, with optional latency and error
+injection. Point the matcher at it with
+
+    SPOTIFY_API=http://127.0.0.1:8900 SPOTIFY_ACCOUNTS=http://127.0.0.1:8900 GENIUS_API=http://127.0.0.1:8900
+"""
+import argparse
+import html
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "tracks.jsonl")
+
+
+class Fixtures:
+    """Tracks loaded from JSONL (flat records or saved Spotify responses, as lib.catalogue accepts)."""
+
+    def __init__(self, paths=(FIXTURES,)):
+        from lib.catalogue import parse_tracks
+        self.tracks = []
+        self.by_query = {}
+        self.by_search = {}
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    for track in parse_tracks(json.loads(line)):
+                        self.add(track)
+
+    def add(self, track):
+        i = len(self.tracks)
+        self.tracks.append(track)
+        self.by_search[f"{track['title']} {track['artist']}".lower()] = i
+        for q in track.get("queries") or [track.get("query")]:
+            if q:
+                self.by_query.setdefault(q, []).append(i)
+
+    def search(self, query, limit=20):
+        ids = self.by_query.get(query)
+        if ids is None:
+            # Unrecorded query: a stable pseudo-random slice of the fixtures.
+            rng = random.Random(zlib.crc32(query.encode()))
+            ids = rng.sample(range(len(self.tracks)), min(limit, len(self.tracks)))
+        return ids[:limit]
+
+    def find(self, q):
+        i = self.by_search.get(q.lower().strip())
+        if i is not None:
+            return [i]
+        words = set(q.lower().split())
+        return [i for i, t in enumerate(self.tracks) if set(t["title"].lower().split()) <= words][:5]
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # The default backlog of 5 drops SYNs under match()'s parallel lyric
+    # fetches, adding 1s retransmits that are not upstream latency.
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class StubServer:
+    """ThreadingHTTPServer wrapper; `latency`/`jitter` in ms, `error_rate` in [0, 1]."""
+
+    def __init__(self, fixtures=None, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_statuses=(500, 503, 429)):
+        self.fixtures = fixtures or Fixtures()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.counts = {}
+        self._lock = threading.Lock()
+        self.httpd = _HTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _count(self, route, status):
+        with self._lock:
+            key = f"{route} {status}"
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; with Nagle on, a
+            # reused keep-alive connection stalls ~40ms on the delayed ACK.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, route, status, body, ctype="application/json", headers=()):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in headers:
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+                stub._count(route, status)
+
+            def _inject(self, route):
+                delay = stub.latency + random.uniform(-stub.jitter, stub.jitter)
+                if delay > 0:
+                    time.sleep(delay / 1000)
+                if stub.error_rate and random.random() < stub.error_rate:
+                    status = random.choice(stub.error_statuses)
+                    headers = [("Retry-After", "1")] if status == 429 else []
+                    self._send(route, status, {"error": "injected"}, headers=headers)
+                    return True
+                return False
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                if urlparse(self.path).path != "/api/token":
+                    return self._send("other", 404, {"error": "not found"})
+                if self._inject("token"):
+                    return
+                self._send("token", 200, {"access_token": "stub-token", "token_type": "Bearer", "expires_in": 3600})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                fx = stub.fixtures
+                if url.path == "/v1/search":
+                    if self._inject("spotify_search"):
+                        return
+                    items = [{
+                        "name": fx.tracks[i]["title"],
+                        "artists": [{"name": fx.tracks[i]["artist"]}],
+                        "popularity": fx.tracks[i].get("popularity", 0),
+                        "external_urls": {"spotify": fx.tracks[i].get("link") or f"{stub.url}/track/{i}"},
+                    } for i in fx.search(params.get("q", ""), int(params.get("limit", 20)))]
+                    return self._send("spotify_search", 200, {"tracks": {"items": items}})
+                if url.path == "/search":
+                    if self._inject("genius_search"):
+                        return
+                    hits = [{"result": {
+                        "title": fx.tracks[i]["title"],
+                        "primary_artist": {"name": fx.tracks[i]["artist"]},
+                        "url": f"{stub.url}/lyrics/{i}",
+                    }} for i in fx.find(params.get("q", ""))]
+                    return self._send("genius_search", 200, {"response": {"hits": hits}})
+                if url.path.startswith("/lyrics/"):
+                    if self._inject("lyrics_page"):
+                        return
+                    try:
+                        track = fx.tracks[int(url.path.rsplit("/", 1)[1])]
+                    except (ValueError, IndexError):
+                        return self._send("lyrics_page", 404, b"", "text/html")
+                    lines = "<br/>".join(html.escape(l) for l in (track.get("lyrics") or "").splitlines())
+                    page = f"<html><body><div data-lyrics-container=\"true\">{lines}</div></body></html>"
+                    return self._send("lyrics_page", 200, page.encode(), "text/html; charset=utf-8")
+                self._send("other", 404, {"error": "not found"})
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Spotify/Genius fixtures locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--fixtures", nargs="+", default=[FIXTURES])
+    parser.add_argument("--latency", type=float, default=0, help="added latency per request, ms")
+    parser.add_argument("--jitter", type=float, default=0, help="uniform +/- jitter, ms")
+    parser.add_argument("--error-rate", type=float, default=0)
+    args = parser.parse_args(argv)
+    stub = StubServer(Fixtures(args.fixtures), args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"stub server on {stub.url} with {len(stub.fixtures.tracks)} tracks")
+    try:
+        stub.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
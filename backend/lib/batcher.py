@@ -0,0 +1,79 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+
+class Batcher:
+    """Micro-batching front for a function that maps a list of inputs to a list of outputs.
+
+    Callers submit single items and get a Future back. A worker thread
+    collects items for up to `max_wait` seconds (or until `max_batch` are
+    queued), runs them through `fn` as one batch and resolves each future.
+    """
+
+    def __init__(self, fn, max_batch=16, max_wait=0.005, name="batcher"):
+        self._fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self._q = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.sizes = Counter()
+
+    def submit(self, item):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+        fut = Future()
+        self._q.put((item, fut))
+        return fut
+
+    def _collect(self):
+        batch = [self._q.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self.batches += 1
+            self.items += len(batch)
+            self.sizes[len(batch)] += 1
+            try:
+                results = list(self._fn([item for item, _ in batch]))
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: {len(results)} results for {len(batch)} inputs")
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res)
+
+    def stats(self):
+        return {
+            "queue_depth": self._q.qsize(),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+            "batch_sizes": dict(sorted(self.sizes.items())),
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from lib.db import DB_PATH, connect
+from lib.lyrics_cache import lyric_words, norm_key
+from lib.scoring import TermMatrix
+
+CATALOGUE_PATH = os.getenv("ECHO_CATALOGUE", os.path.join(os.path.dirname(DB_PATH), "catalogue.db"))
+
+
+def parse_tracks(obj):
+    """Yield flat track dicts from one JSONL record.
+
+    Accepts flat records ({title, artist, popularity, link, lyrics, query}),
+    raw Spotify track objects, and whole Spotify search responses.
+    """
+    if "tracks" in obj and isinstance(obj["tracks"], dict):
+        for item in obj["tracks"].get("items", []):
+            yield from parse_tracks({**item, "query": obj.get("query")})
+        return
+    if "name" in obj and "artists" in obj:
+        yield {
+            "title": obj["name"],
+            "artist": obj["artists"][0]["name"] if obj["artists"] else "",
+            "popularity": obj.get("popularity", 0),
+            "link": obj.get("external_urls", {}).get("spotify"),
+            "lyrics": obj.get("lyrics"),
+            "query": obj.get("query"),
+        }
+        return
+    if obj.get("title") and obj.get("artist"):
+        yield obj
+
+
+class Catalogue:
+    """Local store of tracks, popularity, links and lyrics for offline matching.
+
+    `track_queries` records which mood search each track was found under,
+    so candidates for a mood come from an index lookup instead of Spotify.
+    """
+
+    def __init__(self, path=CATALOGUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._writes = 0
+        self._terms = None
+        self._terms_version = None
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tracks (
+                    id INTEGER PRIMARY KEY,
+                    norm_key TEXT UNIQUE,
+                    title TEXT,
+                    artist TEXT,
+                    popularity INTEGER,
+                    link TEXT,
+                    lyrics TEXT,
+                    words TEXT,
+                    updated_at REAL
+                );
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS track_queries (
+                    query TEXT NOT NULL,
+                    track_id INTEGER NOT NULL,
+                    PRIMARY KEY (query, track_id)
+                ) WITHOUT ROWID;
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_popularity ON tracks(popularity)")
+
+    def upsert(self, track, queries=()):
+        lyrics = track.get("lyrics") or None
+        words = " ".join(sorted(lyric_words(lyrics))) if lyrics else None
+        key = norm_key(track["title"], track["artist"])
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO tracks (norm_key, title, artist, popularity, link, lyrics, words, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (norm_key) DO UPDATE SET
+                    popularity = COALESCE(excluded.popularity, popularity),
+                    link = COALESCE(excluded.link, link),
+                    lyrics = COALESCE(excluded.lyrics, lyrics),
+                    words = COALESCE(excluded.words, words),
+                    updated_at = excluded.updated_at
+                """,
+                (key, track["title"], track["artist"], track.get("popularity"), track.get("link"),
+                 lyrics, words, time.time()),
+            )
+            track_id = self._conn.execute("SELECT id FROM tracks WHERE norm_key = ?", (key,)).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO track_queries (query, track_id) VALUES (?, ?)",
+                [(q, track_id) for q in queries if q],
+            )
+            self._writes += 1
+        return track_id
+
+    def ingest(self, lines, query=None):
+        count = 0
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            for track in parse_tracks(json.loads(line)):
+                queries = track.get("queries") or [track.get("query") or query]
+                self.upsert(track, queries)
+                count += 1
+        return count
+
+    def candidates(self, queries, min_popularity=40, limit=200):
+        marks = ",".join("?" * len(queries))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT id, norm_key, title, artist, popularity, link, lyrics, words, updated_at FROM tracks
+                WHERE id IN (SELECT track_id FROM track_queries WHERE query IN ({marks}))
+                AND popularity >= ?
+                ORDER BY popularity DESC LIMIT ?
+                """,
+                (*queries, min_popularity, limit),
+            ).fetchall()
+        return rows
+
+    def term_matrix(self):
+        """TermMatrix of every track's lyric words, keyed by track id.
+
+        Rebuilt only when this connection or another process (PRAGMA
+        data_version) has written to the catalogue since the last build.
+        """
+        with self._lock:
+            version = (self._conn.execute("PRAGMA data_version").fetchone()[0], self._writes)
+            if self._terms is None or self._terms_version != version:
+                rows = self._conn.execute("SELECT id, words FROM tracks ORDER BY id").fetchall()
+                self._terms = TermMatrix.from_sets(
+                    [(r["words"] or "").split() for r in rows], keys=[r["id"] for r in rows]
+                )
+                self._terms_version = version
+            return self._terms
+
+    def tracks(self, ids):
+        """Rows for catalogue track ids, in the order given (unknown ids are skipped)."""
+        ids = list(ids)
+        if not ids:
+            return []
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, norm_key, title, artist, popularity, link, lyrics, words FROM tracks WHERE id IN ({marks})",
+                ids,
+            ).fetchall()
+        by_id = {row["id"]: row for row in rows}
+        return [by_id[i] for i in ids if i in by_id]
+
+    def tagged(self, ids, queries):
+        """The subset of track `ids` recorded under any of the mood `queries`."""
+        ids = list(ids)
+        if not ids or not queries:
+            return set()
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT DISTINCT track_id FROM track_queries
+                WHERE query IN ({",".join("?" * len(queries))}) AND track_id IN ({",".join("?" * len(ids))})
+                """,
+                (*queries, *ids),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def by_keys(self, keys):
+        """Rows for normalized (title, artist) keys, in the order given (unknown keys are skipped)."""
+        keys = list(keys)
+        if not keys:
+            return []
+        marks = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT id, norm_key, title, artist, popularity, link, lyrics, words, updated_at FROM tracks
+                WHERE norm_key IN ({marks})
+                """,
+                keys,
+            ).fetchall()
+        by_key = {row["norm_key"]: row for row in rows}
+        return [by_key[k] for k in keys if k in by_key]
+
+    def missing_lyrics(self, limit=1000):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, title, artist FROM tracks WHERE lyrics IS NULL LIMIT ?", (limit,)
+            ).fetchall()
+
+    def iter_lyrics(self):
+        conn = connect(self.path)
+        try:
+            for row in conn.execute("SELECT id, norm_key, lyrics, words, updated_at FROM tracks WHERE lyrics IS NOT NULL ORDER BY id"):
+                yield row
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS tracks, COUNT(lyrics) AS with_lyrics FROM tracks"
+            ).fetchone()
+            queries = self._conn.execute("SELECT COUNT(DISTINCT query) FROM track_queries").fetchone()[0]
+        return {"tracks": row["tracks"], "with_lyrics": row["with_lyrics"], "queries": queries}
+
+
+def refresh(cat):
+    """Pull every mood query from Spotify, then fill in missing lyrics from Genius."""
+    from lib.matcher import all_mood_queries, get_spot_token, spotify_search, track_lyrics
+    from lib.upstream import UpstreamError
+    tok = get_spot_token()
+    if not tok:
+        print("Spotify unavailable", file=sys.stderr)
+        return
+    for query in all_mood_queries():
+        try:
+            tracks = spotify_search(query, tok)
+        except UpstreamError as e:
+            print(f"skipping {query!r}: {e}", file=sys.stderr)
+            continue
+        for track in tracks:
+            cat.upsert(track, [query])
+    for row in cat.missing_lyrics():
+        lyrics, _ = track_lyrics({"title": row["title"], "artist": row["artist"]})
+        if lyrics:
+            cat.upsert({"title": row["title"], "artist": row["artist"], "lyrics": lyrics})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local song catalogue.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ing = sub.add_parser("ingest", help="load tracks from JSONL dumps or saved Spotify responses")
+    ing.add_argument("files", nargs="+")
+    ing.add_argument("--query", help="tag every ingested track with this mood query")
+    sub.add_parser("refresh", help="re-fetch mood queries and lyrics from the live APIs")
+    sub.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    cat = Catalogue()
+    if args.command == "ingest":
+        total = 0
+        for path in args.files:
+            with (sys.stdin if path == "-" else open(path)) as f:
+                total += cat.ingest(f, query=args.query)
+        print(f"ingested {total} tracks")
+    elif args.command == "refresh":
+        refresh(cat)
+    print(json.dumps(cat.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import sqlite3
+import threading
+
+from lib.metrics import METRICS_ENABLED, span
+
+DB_PATH = os.environ.get("ECHO_DB", os.path.join(os.path.dirname(os.path.dirname(__file__)), "echo.db"))
+# Seconds a connection waits on a locked database (sqlite3's busy timeout).
+DB_BUSY_TIMEOUT = float(os.environ.get("ECHO_DB_TIMEOUT", "30"))
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA temp_store = MEMORY",
+)
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose execute/executemany are timed as the "sqlite" stage."""
+
+    def execute(self, *args):
+        with span("sqlite"):
+            return super().execute(*args)
+
+    def executemany(self, *args):
+        with span("sqlite"):
+            return super().executemany(*args)
+
+
+_local = threading.local()
+_open = []
+_open_lock = threading.Lock()
+# Bumped by close_all(); a thread holding connections from an older
+# generation drops them and reconnects.
+_generation = 0
+
+
+def connect(path=DB_PATH):
+    factory = TimedConnection if METRICS_ENABLED else sqlite3.Connection
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False, factory=factory)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def thread_connection(path=DB_PATH):
+    """Return this thread's long-lived connection to `path`, opening it on first use."""
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.generation != _generation:
+        conns = _local.conns = {}
+        _local.generation = _generation
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = connect(path)
+        with _open_lock:
+            _open.append(conn)
+    return conn
+
+
+def close_all():
+    global _generation
+    with _open_lock:
+        _generation += 1
+        for conn in _open:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _open.clear()
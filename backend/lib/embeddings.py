@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+from lib.db import DB_PATH, connect
+from lib.semantics import models
+
+EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBED_DIR = os.getenv("ECHO_EMBEDDINGS", os.path.join(os.path.dirname(DB_PATH), "embeddings"))
+EMBED_WEIGHT = float(os.getenv("EMBED_WEIGHT", "40"))
+# Nearest indexed lyrics added to match()'s candidates.
+EMBED_TOP_K = int(os.getenv("EMBED_TOP_K", "50"))
+EMBED_DTYPES = {"float16": np.float16, "float32": np.float32}
+
+
+class Embedder:
+    """Mean-pooled, L2-normalised sentence embeddings from a transformers encoder on CPU."""
+
+    def __init__(self, model=EMBED_MODEL, max_length=256):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+        self._torch = torch
+        self.tokenizer = AutoTokenizer.from_pretrained(model)
+        self.model = AutoModel.from_pretrained(model).eval()
+        self.max_length = max_length
+        self.dim = self.model.config.hidden_size
+
+    def encode(self, texts, batch_size=32):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        with self._torch.no_grad():
+            for i in range(0, len(texts), batch_size):
+                enc = self.tokenizer(texts[i:i + batch_size], padding=True, truncation=True,
+                                     max_length=self.max_length, return_tensors="pt")
+                hidden = self.model(**enc).last_hidden_state
+                mask = enc["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+                out[i:i + len(pooled)] = self._torch.nn.functional.normalize(pooled, dim=1).numpy()
+        return out
+
+
+class EmbeddingIndex:
+    """Append-only matrix of unit-length embeddings, memory-mapped from disk.
+
+    `vectors.bin` holds rows of `dim` values in `dtype`, `ids.txt` the id
+    of each row in order, and `meta.json` the model, dim and dtype. New
+    items are appended in streaming batches, so rebuilding never rewrites
+    existing rows; readers remap the file after an append, and
+    refresh() remaps it when another process (the build CLI) has appended.
+    """
+
+    def __init__(self, path=EMBED_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self.meta = None
+        self.ids = []
+        self.pos = {}
+        self.vectors = None
+        self._stamp = None
+        self.reload()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _files_stamp(self):
+        try:
+            return tuple((st.st_size, st.st_mtime_ns) for st in map(os.stat, (
+                self._file("meta.json"), self._file("ids.txt"), self._file("vectors.bin"))))
+        except OSError:
+            return None
+
+    def refresh(self):
+        """Reload if the files changed on disk since the last load."""
+        if self._files_stamp() != self._stamp:
+            with self._lock:
+                self.reload()
+
+    def reload(self):
+        self._stamp = self._files_stamp()
+        try:
+            with open(self._file("meta.json")) as f:
+                meta = json.load(f)
+            with open(self._file("ids.txt")) as f:
+                ids = f.read().splitlines()
+        except (OSError, ValueError):
+            return
+        dtype = EMBED_DTYPES[meta["dtype"]]
+        row_bytes = meta["dim"] * np.dtype(dtype).itemsize
+        n = min(len(ids), os.path.getsize(self._file("vectors.bin")) // row_bytes)
+        self.meta = meta
+        self.ids = ids[:n]
+        self.pos = {id_: i for i, id_ in enumerate(self.ids)}
+        self.vectors = (np.memmap(self._file("vectors.bin"), dtype=dtype, mode="r", shape=(n, meta["dim"]))
+                        if n else None)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, items, embedder, dtype="float16", batch=256):
+        """Embed and append every (id, text) in `items` whose id is not indexed yet."""
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            if self.meta is None:
+                self.meta = {"model": EMBED_MODEL, "dim": embedder.dim, "dtype": dtype}
+                with open(self._file("meta.json"), "w") as f:
+                    json.dump(self.meta, f)
+            np_dtype = EMBED_DTYPES[self.meta["dtype"]]
+            seen = set(self.pos)
+            added = 0
+            pending = []
+
+            def flush():
+                vecs = embedder.encode([text for _, text in pending]).astype(np_dtype)
+                with open(self._file("vectors.bin"), "ab") as f:
+                    f.write(vecs.tobytes())
+                with open(self._file("ids.txt"), "a") as f:
+                    f.write("".join(id_ + "\n" for id_, _ in pending))
+                pending.clear()
+
+            for id_, text in items:
+                if id_ in seen or not text:
+                    continue
+                seen.add(id_)
+                pending.append((id_, text))
+                if len(pending) >= batch:
+                    added += len(pending)
+                    flush()
+            if pending:
+                added += len(pending)
+                flush()
+            self.reload()
+        return added
+
+    def similarity(self, vec, ids):
+        """Cosine similarity of `vec` to each id in `ids` (0.0 for unindexed ids)."""
+        sims = np.zeros(len(ids), dtype=np.float32)
+        vectors, pos = self.vectors, self.pos  # refresh() may swap both mid-call
+        if vectors is None:
+            return sims
+        rows = [(i, pos[id_]) for i, id_ in enumerate(ids) if pos.get(id_, len(vectors)) < len(vectors)]
+        if rows:
+            where, idx = zip(*rows)
+            sims[list(where)] = vectors[list(idx)].astype(np.float32) @ vec
+        return sims
+
+    def top_k(self, vec, k=50, chunk=65536):
+        """Best `k` (id, similarity) pairs over the whole index in one pass."""
+        vectors, ids = self.vectors, self.ids
+        if vectors is None or not k:
+            return []
+        n = min(len(ids), len(vectors))
+        sims = np.empty(n, dtype=np.float32)
+        for i in range(0, n, chunk):
+            sims[i:i + chunk] = vectors[i:min(i + chunk, n)].astype(np.float32) @ vec
+        k = min(k, n)
+        best = np.argpartition(-sims, k - 1)[:k]
+        best = best[np.argsort(-sims[best])]
+        return [(ids[i], float(sims[i])) for i in best]
+
+
+embedding_index = EmbeddingIndex()
+
+
+def load_embedder():
+    return Embedder(embedding_index.meta["model"] if embedding_index.meta else EMBED_MODEL)
+
+
+def get_embedder():
+    # Registering is idempotent; doing it here covers an index built after startup.
+    models.register("embedder", load_embedder)
+    return models.get("embedder")
+
+
+def embed_query(txt):
+    return get_embedder().encode([txt])[0]
+
+
+# Warm the encoder with the other models only when there is an index to query.
+if embedding_index.meta:
+    models.register("embedder", load_embedder)
+
+
+def lyrics_cache_items(path=DB_PATH):
+    conn = connect(path)
+    try:
+        for row in conn.execute("SELECT norm_key, lyrics FROM lyrics_cache ORDER BY fetched_at"):
+            yield row["norm_key"], row["lyrics"]
+    finally:
+        conn.close()
+
+
+def catalogue_items():
+    from lib.catalogue import Catalogue
+    for row in Catalogue().iter_lyrics():
+        yield row["norm_key"], row["lyrics"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the lyric embedding index.")
+    parser.add_argument("command", choices=["build", "info"])
+    # match() resolves neighbours through the catalogue, so index its tracks by default.
+    parser.add_argument("--source", choices=["catalogue", "lyrics_cache"], default="catalogue")
+    parser.add_argument("--dtype", choices=sorted(EMBED_DTYPES), default="float16")
+    parser.add_argument("--batch", type=int, default=256)
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        items = catalogue_items() if args.source == "catalogue" else lyrics_cache_items()
+        added = embedding_index.add(items, load_embedder(), dtype=args.dtype, batch=args.batch)
+        print(f"added {added} tracks, {len(embedding_index)} indexed")
+    else:
+        print(json.dumps({"size": len(embedding_index), "meta": embedding_index.meta}))
+
+
+if __name__ == "__main__":
+    main()
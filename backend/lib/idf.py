@@ -0,0 +1,119 @@
+import re
+import threading
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from lib.db import DB_PATH, connect
+
+TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+
+
+def doc_terms(txt):
+    return [t for t in TOKEN_RE.findall(txt.lower()) if t not in ENGLISH_STOP_WORDS]
+
+
+class IdfIndex:
+    """Document frequencies over all journal entry text.
+
+    The table `term_df` is the persistent copy; in memory the vocabulary
+    is a term -> slot dict over an int32 document-frequency array. Entries
+    are folded in with add/remove/replace as they are written, so keyword
+    scoring never fits a vectorizer. IDF uses scikit-learn's smoothed form.
+    """
+
+    def __init__(self, path=DB_PATH, clean=None):
+        self._clean = clean or (lambda txt: txt)
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self.vocab = {}
+        self.df = np.zeros(1024, dtype=np.int32)
+        self.n_docs = 0
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS term_df (term TEXT PRIMARY KEY, df INTEGER NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS idf_meta (key TEXT PRIMARY KEY, value INTEGER)")
+        row = self._conn.execute("SELECT value FROM idf_meta WHERE key = 'n_docs'").fetchone()
+        if row is None:
+            self.rebuild()
+        else:
+            self._load(row["value"])
+
+    def _slot(self, term):
+        # Grow df before publishing the slot: keywords() reads without the lock.
+        i = self.vocab.get(term)
+        if i is None:
+            i = len(self.vocab)
+            if i >= len(self.df):
+                self.df = np.concatenate([self.df, np.zeros(len(self.df), dtype=np.int32)])
+            self.vocab[term] = i
+        return i
+
+    def _load(self, n_docs):
+        rows = self._conn.execute("SELECT term, df FROM term_df").fetchall()
+        self.vocab = {row["term"]: i for i, row in enumerate(rows)}
+        self.df = np.zeros(max(1024, 2 * len(rows)), dtype=np.int32)
+        self.df[:len(rows)] = [row["df"] for row in rows]
+        self.n_docs = n_docs
+
+    def rebuild(self):
+        counts = {}
+        n_docs = 0
+        has_entries = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'journal_entries'"
+        ).fetchone()
+        if has_entries:
+            for row in self._conn.execute("SELECT text FROM journal_entries"):
+                n_docs += 1
+                for t in set(doc_terms(self._clean(row["text"] or ""))):
+                    counts[t] = counts.get(t, 0) + 1
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM term_df")
+            self._conn.executemany("INSERT INTO term_df (term, df) VALUES (?, ?)", counts.items())
+            self._conn.execute("INSERT OR REPLACE INTO idf_meta (key, value) VALUES ('n_docs', ?)", (n_docs,))
+            self._load(n_docs)
+
+    def _apply(self, txt, sign):
+        terms = set(doc_terms(self._clean(txt or "")))
+        with self._lock, self._conn:
+            if sign > 0:
+                self._conn.executemany(
+                    "INSERT INTO term_df (term, df) VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET df = df + 1",
+                    [(t,) for t in terms],
+                )
+            else:
+                self._conn.executemany(
+                    "UPDATE term_df SET df = max(df - 1, 0) WHERE term = ?", [(t,) for t in terms]
+                )
+                terms = [t for t in terms if t in self.vocab]
+            self._conn.execute("UPDATE idf_meta SET value = max(value + ?, 0) WHERE key = 'n_docs'", (sign,))
+            for t in terms:
+                i = self._slot(t)
+                self.df[i] = max(self.df[i] + sign, 0)
+            self.n_docs = max(self.n_docs + sign, 0)
+
+    def add(self, txt):
+        self._apply(txt, 1)
+
+    def remove(self, txt):
+        self._apply(txt, -1)
+
+    def replace(self, old, new):
+        self._apply(old, -1)
+        self._apply(new, 1)
+
+    def keywords(self, txt, top=5):
+        counts = {}
+        for t in doc_terms(txt):
+            counts[t] = counts.get(t, 0) + 1
+        if not counts:
+            return []
+        terms = sorted(counts)
+        tf = np.array([counts[t] for t in terms], dtype=np.float64)
+        # Lock-free read: take one df array and ignore slots it does not cover
+        # (published by a concurrent rebuild after this snapshot).
+        vocab, dfs, n_docs = self.vocab, self.df, self.n_docs
+        slots = [vocab.get(t, len(dfs)) for t in terms]
+        df = np.array([dfs[i] if i < len(dfs) else 0 for i in slots], dtype=np.float64)
+        scores = tf * (np.log((1 + n_docs) / (1 + df)) + 1)
+        order = np.argsort(-scores, kind="stable")[:top]
+        return [terms[i] for i in order]
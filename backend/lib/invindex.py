@@ -0,0 +1,233 @@
+import argparse
+import json
+import threading
+import time
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from lib.catalogue import CATALOGUE_PATH, Catalogue
+from lib.db import connect
+from lib.lyrics_cache import WORD_RE
+from lib.scoring import TermMatrix
+
+
+def encode_varints(values):
+    """LEB128-encode a non-negative integer array (7 bits per byte, high bit = more)."""
+    v = np.asarray(values, dtype=np.uint64)
+    if not len(v):
+        return b""
+    nbytes = np.ones(len(v), dtype=np.int64)
+    rest = v >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+    width = int(nbytes.max())
+    shifts = np.arange(width, dtype=np.uint64) * np.uint64(7)
+    groups = ((v[:, None] >> shifts) & np.uint64(0x7F)).astype(np.uint8)
+    more = np.arange(width) < (nbytes[:, None] - 1)
+    groups[more] |= 0x80
+    return groups[np.arange(width) < nbytes[:, None]].tobytes()
+
+
+def decode_varints(buf):
+    b = np.frombuffer(buf, dtype=np.uint8)
+    if not len(b):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(b < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    pos = np.arange(len(b)) - np.repeat(starts, ends - starts + 1)
+    vals = (b & 0x7F).astype(np.uint64) << (pos.astype(np.uint64) * np.uint64(7))
+    return np.add.reduceat(vals, starts).astype(np.int64)
+
+
+def encode_postings(ids, tfs):
+    ids = np.asarray(ids, dtype=np.int64)
+    return encode_varints(np.concatenate((np.diff(ids, prepend=0), tfs)))
+
+
+def decode_postings(data, df):
+    vals = decode_varints(data)
+    return np.cumsum(vals[:df]), vals[df:]
+
+
+class LyricIndex:
+    """Inverted index over catalogue lyrics: term -> (track ids, term frequencies).
+
+    Postings live next to the catalogue as one blob per term: delta-encoded
+    track ids followed by their term frequencies, both as varints. Queries
+    decode only the postings of the entry's own terms and accumulate overlap
+    per track, so lyric relevance over the whole catalogue is a retrieval
+    step instead of a per-track set intersection. `lyric_terms` holds each
+    track's distinct term count (for Jaccard) and the `updated_at` it was
+    indexed at, so rows changed since the last build can be detected.
+    """
+
+    def __init__(self, path=CATALOGUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        self._built = None
+        self.doc_ids = np.zeros(0, dtype=np.int64)
+        self.doc_sizes = np.zeros(0, dtype=np.int64)
+        self.doc_updated = np.zeros(0, dtype=np.float64)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS lyric_postings (term TEXT PRIMARY KEY, df INTEGER, data BLOB) WITHOUT ROWID"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS lyric_terms (track_id INTEGER PRIMARY KEY, n INTEGER, updated_at REAL)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS lyric_index_meta (key TEXT PRIMARY KEY, value REAL)")
+
+    def __len__(self):
+        self._sync()
+        return len(self.doc_ids)
+
+    def _sync(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM lyric_index_meta WHERE key = 'built_at'").fetchone()
+            built = row["value"] if row else None
+            if built == self._built:
+                return
+            docs = self._conn.execute("SELECT track_id, n, updated_at FROM lyric_terms ORDER BY track_id").fetchall()
+            self.doc_ids = np.array([d["track_id"] for d in docs], dtype=np.int64)
+            self.doc_sizes = np.array([d["n"] for d in docs], dtype=np.int64)
+            self.doc_updated = np.array([d["updated_at"] or 0 for d in docs], dtype=np.float64)
+            self._built = built
+
+    def build(self, catalogue):
+        ids, tfs = {}, {}
+        docs = []
+        for row in catalogue.iter_lyrics():
+            counts = Counter(WORD_RE.findall(row["lyrics"].lower()))
+            for term, tf in counts.items():
+                if term not in ids:
+                    ids[term], tfs[term] = array("q"), array("q")
+                ids[term].append(row["id"])
+                tfs[term].append(tf)
+            docs.append((row["id"], len(counts), row["updated_at"]))
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM lyric_postings")
+            self._conn.execute("DELETE FROM lyric_terms")
+            self._conn.executemany(
+                "INSERT INTO lyric_postings (term, df, data) VALUES (?, ?, ?)",
+                ((t, len(ids[t]), encode_postings(ids[t], tfs[t])) for t in ids),
+            )
+            self._conn.executemany("INSERT INTO lyric_terms (track_id, n, updated_at) VALUES (?, ?, ?)", docs)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO lyric_index_meta (key, value) VALUES ('built_at', ?)", (time.time(),)
+            )
+        self._sync()
+        return len(docs)
+
+    def _counts(self, terms):
+        """Per-document overlap and summed tf for `terms`, aligned with doc_ids."""
+        self._sync()
+        overlap = np.zeros(len(self.doc_ids), dtype=np.int64)
+        tf = np.zeros(len(self.doc_ids), dtype=np.int64)
+        terms = list(terms)
+        if not terms or not len(self.doc_ids):
+            return overlap, tf
+        marks = ",".join("?" * len(terms))
+        with self._lock:
+            rows = self._conn.execute(f"SELECT df, data FROM lyric_postings WHERE term IN ({marks})", terms).fetchall()
+        for row in rows:
+            ids, freqs = decode_postings(row["data"], row["df"])
+            pos = np.searchsorted(self.doc_ids, ids)
+            overlap[pos] += 1
+            tf[pos] += freqs
+        return overlap, tf
+
+    def query(self, words, top=None):
+        """Tracks sharing at least one term with `words`, best overlap first.
+
+        Returns {"ids", "overlap", "tf", "jaccard"} as aligned arrays.
+        """
+        words = set(words)
+        overlap, tf = self._counts(words)
+        hit = np.flatnonzero(overlap)
+        union = len(words) + self.doc_sizes[hit] - overlap[hit]
+        jaccard = overlap[hit] / np.maximum(union, 1)
+        order = np.lexsort((-tf[hit], -overlap[hit]))[:top]
+        hit = hit[order]
+        return {"ids": self.doc_ids[hit], "overlap": overlap[hit], "tf": tf[hit], "jaccard": jaccard[order]}
+
+    def terms(self, ids, updated, words):
+        """IndexedTerms for catalogue rows `ids`; see that class for stale rows."""
+        return IndexedTerms(self, ids, updated, words)
+
+
+class IndexedTerms:
+    """Duck-types TermMatrix for lib.scoring, answering overlap from the index.
+
+    Rows missing from the index or updated since it was built fall back to a
+    small TermMatrix over their stored `words`.
+    """
+
+    def __init__(self, index, ids, updated, words):
+        index._sync()
+        ids = np.asarray(ids, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(index.doc_ids, ids), max(len(index.doc_ids) - 1, 0))
+        self.index = index
+        self.pos = pos
+        if len(index.doc_ids):
+            self.stale = (index.doc_ids[pos] != ids) | (index.doc_updated[pos] != np.asarray(updated, dtype=np.float64))
+            self.sizes = index.doc_sizes[pos].copy()
+        else:
+            self.stale = np.ones(len(ids), dtype=bool)
+            self.sizes = np.zeros(len(ids), dtype=np.int64)
+        self.fallback = None
+        if self.stale.any():
+            self.fallback = TermMatrix.from_sets([(words[i] or "").split() for i in np.flatnonzero(self.stale)])
+            self.sizes[self.stale] = self.fallback.sizes
+
+    def __len__(self):
+        return len(self.pos)
+
+    def overlap(self, words):
+        counts, _ = self.index._counts(words)
+        out = counts[self.pos].astype(np.float64) if len(counts) else np.zeros(len(self.pos))
+        if self.fallback is not None:
+            out[self.stale] = self.fallback.overlap(words)
+        return out
+
+
+lyric_index = None
+_lyric_index_lock = threading.Lock()
+
+
+def get_lyric_index():
+    global lyric_index
+    if lyric_index is None:
+        with _lyric_index_lock:
+            if lyric_index is None:
+                lyric_index = LyricIndex()
+    return lyric_index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the catalogue lyric index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="rebuild postings from every catalogue track with lyrics")
+    sub.add_parser("stats")
+    q = sub.add_parser("query", help="rank catalogue tracks by lyric overlap with some text")
+    q.add_argument("text")
+    q.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    index = get_lyric_index()
+    if args.command == "build":
+        print(f"indexed {index.build(Catalogue())} tracks")
+    elif args.command == "query":
+        res = index.query(WORD_RE.findall(args.text.lower()), top=args.top)
+        for row in zip(*(res[k].tolist() for k in ("ids", "overlap", "tf", "jaccard"))):
+            print(*row, sep="\t")
+        return
+    terms = index._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM lyric_postings").fetchone()
+    print(json.dumps({"tracks": len(index), "terms": terms[0], "postings_bytes": terms[1]}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import os
+import re
+import threading
+import time
+
+from lib.db import DB_PATH, connect
+from lib.metrics import register_cache
+
+LYRICS_TTL = float(os.getenv("LYRICS_TTL", str(7 * 24 * 3600)))
+LYRICS_CACHE_MAX = int(os.getenv("LYRICS_CACHE_MAX", "5000"))
+
+WORD_RE = re.compile(r'\b\w{4,}\b')
+
+
+def norm_key(title, artist):
+    return " ".join(title.lower().split()) + "|" + " ".join(artist.lower().split())
+
+
+def lyric_words(lyrics):
+    return set(WORD_RE.findall(lyrics.lower()))
+
+
+class LyricsCache:
+    """Extracted Genius lyrics plus their word sets, stored in SQLite.
+
+    Rows are keyed by Genius URL and indexed by normalized (title, artist).
+    Entries older than `ttl` seconds are dropped on read, and once the table
+    grows past `max_size` rows the least recently used ones are evicted.
+    A lookup by (title, artist) that falls back to the URL counts once:
+    get() only records hits, and get_url() or miss() settles the rest.
+    """
+
+    def __init__(self, path=DB_PATH, ttl=LYRICS_TTL, max_size=LYRICS_CACHE_MAX):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.url_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = connect(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS lyrics_cache (
+                    url TEXT PRIMARY KEY,
+                    norm_key TEXT,
+                    lyrics TEXT,
+                    words TEXT,
+                    fetched_at REAL,
+                    last_used REAL
+                );
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_lyrics_cache_key ON lyrics_cache(norm_key)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_lyrics_cache_used ON lyrics_cache(last_used)")
+
+    def _find(self, column, value, hit, miss=None):
+        """Fresh row for `column = value`; bumps the `hit` or `miss` counter (if any) under the lock."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT url, lyrics, words, fetched_at FROM lyrics_cache WHERE {column} = ? "
+                "ORDER BY fetched_at DESC LIMIT 1",
+                (value,),
+            ).fetchone()
+            if row is not None and now - row["fetched_at"] > self.ttl:
+                self._conn.execute("DELETE FROM lyrics_cache WHERE url = ?", (row["url"],))
+                row = None
+            if row is None:
+                if miss:
+                    setattr(self, miss, getattr(self, miss) + 1)
+                return None
+            self._conn.execute("UPDATE lyrics_cache SET last_used = ? WHERE url = ?", (now, row["url"]))
+            setattr(self, hit, getattr(self, hit) + 1)
+        return row["lyrics"], set(row["words"].split())
+
+    def get(self, title, artist):
+        return self._find("norm_key", norm_key(title, artist), "hits")
+
+    def get_url(self, url):
+        return self._find("url", url, "url_hits", "misses")
+
+    def miss(self):
+        """Record a lookup that ended before reaching get_url() (no Genius hit)."""
+        with self._lock:
+            self.misses += 1
+
+    def put(self, url, title, artist, lyrics):
+        words = lyric_words(lyrics)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO lyrics_cache (url, norm_key, lyrics, words, fetched_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, norm_key(title, artist), lyrics, " ".join(sorted(words)), now, now),
+            )
+            size = self._conn.execute("SELECT COUNT(*) FROM lyrics_cache").fetchone()[0]
+            if size > self.max_size:
+                self._conn.execute(
+                    "DELETE FROM lyrics_cache WHERE url IN "
+                    "(SELECT url FROM lyrics_cache ORDER BY last_used LIMIT ?)",
+                    (size - self.max_size,),
+                )
+        return lyrics, words
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM lyrics_cache")
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM lyrics_cache").fetchone()[0]
+            hits, url_hits, misses = self.hits, self.url_hits, self.misses
+        return {"hits": hits + url_hits, "url_hits": url_hits, "misses": misses, "size": size}
+
+
+lyrics_cache = LyricsCache()
+register_cache("lyrics", lyrics_cache.stats)
@@ -1,17 +1,54 @@
-import requests, base64, re #type: ignore
+import base64
 from bs4 import BeautifulSoup #type: ignore
 from lib.semantics import ana
+from lib.lyrics_cache import lyrics_cache, norm_key
+from lib.tokens import TokenCache
+from lib.pools import PoolService
+from lib.embeddings import EMBED_TOP_K, EMBED_WEIGHT, embedding_index, embed_query
+from lib.scoring import LIB_WEIGHTS, TermMatrix, score_tracks, rank_tracks
+from lib.metrics import register_cache, span, timed
+from lib.upstream import UpstreamError, upstream
 from dotenv import load_dotenv #type: ignore
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextvars
+import numpy as np
 import os
+import threading
 load_dotenv()
 
 GENIUS_KEY = os.getenv("GENIUS_KEY")
 SPOT_ID = os.getenv("SPOT_ID")
 SPOT_SEC = os.getenv("SPOT_SEC")
 
+# Upstream base URLs; the benchmark suite points these at bench/stub_server.py.
+SPOTIFY_API = os.getenv("SPOTIFY_API", "https://api.spotify.com")
+SPOTIFY_ACCOUNTS = os.getenv("SPOTIFY_ACCOUNTS", "https://accounts.spotify.com")
+GENIUS_API = os.getenv("GENIUS_API", "https://api.genius.com")
+
+# "live" searches Spotify/Genius (through the pools and caches); "catalogue"
+# matches entirely against the local catalogue built by `python -m lib.catalogue`.
+MATCH_BACKEND = os.getenv("MATCH_BACKEND", "live")
+
+# Bump whenever match() scoring changes so cached recommendations are not reused.
+SCORER_VERSION = "4"
+
+# Catalogue candidates scored per request; scoring is batched, so this can be large.
+MATCH_CANDIDATES = int(os.getenv("MATCH_CANDIDATES", "500"))
+
+# Genius fan-out: at most MATCH_WORKERS lookups in flight, and match() stops
+# waiting after MATCH_DEADLINE seconds; late tracks are scored on metadata only.
+MATCH_WORKERS = int(os.getenv("MATCH_WORKERS", "8"))
+MATCH_DEADLINE = float(os.getenv("MATCH_DEADLINE", "8"))
+
+_fetch_pool = ThreadPoolExecutor(max_workers=MATCH_WORKERS, thread_name_prefix="genius")
+
+@timed("genius.search")
 def g_search(q):
     h = {"Authorization": f"Bearer {GENIUS_KEY}"}
-    r = requests.get("https://api.genius.com/search", headers=h, params={"q": q})
+    try:
+        r = upstream.get(f"{GENIUS_API}/search", headers=h, params={"q": q})
+    except UpstreamError:
+        return []
     if r.status_code != 200: 
         return []
     hits = r.json().get("response", {}).get("hits", [])
@@ -20,22 +57,39 @@ def g_search(q):
 
 def get_lyrics(u):
     try:
-        r = requests.get(u, timeout=10)
+        with span("genius.lyrics_fetch"):
+            r = upstream.get(u)
         if r.status_code != 200: return ""
-        soup = BeautifulSoup(r.text, "html.parser")
-        divs = soup.select("div[data-lyrics-container='true']")
-        return "\n".join([d.get_text(separator="\n") for d in divs]).strip()
+        with span("genius.lyrics_parse"):
+            soup = BeautifulSoup(r.text, "html.parser")
+            divs = soup.select("div[data-lyrics-container='true']")
+            return "\n".join([d.get_text(separator="\n") for d in divs]).strip()
     except:
         return ""
 
 
-def get_spot_token():
+@timed("spotify.token")
+def fetch_spot_token():
     a = f"{SPOT_ID}:{SPOT_SEC}"
     b64 = base64.b64encode(a.encode()).decode()
     h = {"Authorization": f"Basic {b64}", "Content-Type": "application/x-www-form-urlencoded"}  
     d = {"grant_type": "client_credentials"}
-    r = requests.post("https://accounts.spotify.com/api/token", headers=h, data=d)
-    return r.json().get("access_token") if r.status_code == 200 else None
+    try:
+        r = upstream.post(f"{SPOTIFY_ACCOUNTS}/api/token", headers=h, data=d)
+    except UpstreamError:
+        return None, 0
+    if r.status_code != 200:
+        return None, 0
+    body = r.json()
+    return body.get("access_token"), body.get("expires_in", 3600)
+
+
+spot_tokens = TokenCache(fetch_spot_token)
+register_cache("spotify_token", spot_tokens.stats)
+
+
+def get_spot_token():
+    return spot_tokens.get()
 
 
 def is_english_song(title, artist):
@@ -57,109 +111,236 @@ def is_english_song(title, artist):
     return latin_ratio > 0.85 and not has_non_english
 
 
-def get_popular_songs_by_emotion(emotion, sentiment, tok):
-    h = {"Authorization": f"Bearer {tok}"}
-    
-    emotion_queries = {
-        'joy': ['happy songs', 'feel good music', 'upbeat pop'],
-        'sadness': ['sad songs', 'heartbreak songs', 'emotional ballads'], 
-        'anger': ['angry songs', 'rock music', 'metal songs'],
-        'love': ['love songs', 'romantic music', 'love ballads'],
-        'fear': ['anxiety songs', 'sad music', 'emotional songs'],
-        'surprise': ['upbeat music', 'pop songs', 'dance music']
-    }
-    
-    sentiment_queries = {
-        'positive': ['happy music', 'pop hits', 'feel good songs'],
-        'very positive': ['celebration songs', 'party music', 'dance hits'],
-        'negative': ['sad music', 'melancholy songs', 'breakup songs'],
-        'very negative': ['depressing songs', 'dark music', 'sad ballads'],
-        'neutral': ['chill music', 'indie songs', 'alternative music']
-    }
-    
+EMOTION_QUERIES = {
+    'joy': ['happy songs', 'feel good music', 'upbeat pop'],
+    'sadness': ['sad songs', 'heartbreak songs', 'emotional ballads'], 
+    'anger': ['angry songs', 'rock music', 'metal songs'],
+    'love': ['love songs', 'romantic music', 'love ballads'],
+    'fear': ['anxiety songs', 'sad music', 'emotional songs'],
+    'surprise': ['upbeat music', 'pop songs', 'dance music']
+}
+
+SENTIMENT_QUERIES = {
+    'positive': ['happy music', 'pop hits', 'feel good songs'],
+    'very positive': ['celebration songs', 'party music', 'dance hits'],
+    'negative': ['sad music', 'melancholy songs', 'breakup songs'],
+    'very negative': ['depressing songs', 'dark music', 'sad ballads'],
+    'neutral': ['chill music', 'indie songs', 'alternative music']
+}
+
+# emo() can also return these labels, which have no dedicated queries.
+EXTRA_EMOTIONS = ['disgust', 'neutral']
+
+
+def mood_queries(emotion, sentiment):
     queries = []
-    if emotion in emotion_queries:
-        queries.extend(emotion_queries[emotion])
-    if sentiment in sentiment_queries:
-        queries.extend(sentiment_queries[sentiment])
+    if emotion in EMOTION_QUERIES:
+        queries.extend(EMOTION_QUERIES[emotion])
+    if sentiment in SENTIMENT_QUERIES:
+        queries.extend(SENTIMENT_QUERIES[sentiment])
     
     if not queries:
         queries = ['popular songs', 'top hits']
+    return queries[:2]
+
+
+def all_mood_queries():
+    queries = [q for qs in list(EMOTION_QUERIES.values()) + list(SENTIMENT_QUERIES.values()) for q in qs]
+    return list(dict.fromkeys(queries + ['popular songs', 'top hits']))
+
+
+@timed("spotify.search")
+def spotify_search(query, tok):
+    h = {"Authorization": f"Bearer {tok}"}
+    p = {"q": query, "type": "track", "limit": 20, "market": "US"}
+    r = upstream.get(f"{SPOTIFY_API}/v1/search", headers=h, params=p)
+    if r.status_code == 401:
+        spot_tokens.invalidate()
+    if r.status_code != 200:
+        return []
+    items = r.json().get("tracks", {}).get("items", [])
+    return [{
+        "title": item["name"],
+        "artist": item["artists"][0]["name"],
+        "popularity": item["popularity"],
+        "link": item["external_urls"]["spotify"]
+    } for item in items]
+
+
+def get_popular_songs_by_emotion(emotion, sentiment, tok):
+    queries = mood_queries(emotion, sentiment)
     
     all_tracks = []
     
-    for query in queries[:2]:
-        p = {"q": query, "type": "track", "limit": 20, "market": "US"}
-        r = requests.get("https://api.spotify.com/v1/search", headers=h, params=p)
-        if r.status_code == 200:
-            items = r.json().get("tracks", {}).get("items", [])
-            for item in items:
-                title = item["name"]
-                artist = item["artists"][0]["name"]
-                
-                if is_english_song(title, artist) and item["popularity"] >=40:
-                    all_tracks.append({
-                        "title": title,
-                        "artist": artist,
-                        "popularity": item["popularity"],
-                        "link": item["external_urls"]["spotify"]
-                    })
+    for query in queries:
+        for track in spotify_search(query, tok):
+            if is_english_song(track["title"], track["artist"]) and track["popularity"] >=40:
+                all_tracks.append(track)
     
     all_tracks.sort(key=lambda x: x["popularity"], reverse=True)
     return all_tracks[:15]
     
 
-def match(txt, ana_fn):
-    res = ana_fn(txt)
-    
-    s_tok = get_spot_token() 
+def live_tracks(emotion, sentiment):
+    s_tok = get_spot_token()
     if not s_tok:
-        return "Spotify unavailable"
+        return []
+    return get_popular_songs_by_emotion(emotion, sentiment, s_tok)
+
+
+candidate_pools = PoolService(
+    live_tracks,
+    [(e, s) for e in list(EMOTION_QUERIES) + EXTRA_EMOTIONS for s in SENTIMENT_QUERIES],
+    group=lambda e, s: tuple(mood_queries(e, s)),
+)
+
+
+def track_lyrics(track):
+    cached = lyrics_cache.get(track["title"], track["artist"])
+    if cached:
+        return cached
+    genius_hits = g_search(f"{track['title']} {track['artist']}")
+    if not genius_hits:
+        lyrics_cache.miss()
+        return "", set()
+    url = genius_hits[0][2]
+    cached = lyrics_cache.get_url(url)
+    if cached:
+        return cached
+    lyrics = get_lyrics(url)
+    if not lyrics:
+        return "", set()
+    return lyrics_cache.put(url, track["title"], track["artist"], lyrics)
+
+
+@timed("match.lyrics")
+def fetch_lyrics(tracks, deadline=None):
+    deadline = MATCH_DEADLINE if deadline is None else deadline
+    # Each lookup runs in a copy of the caller's context so its spans land in the request's Server-Timing.
+    futs = {_fetch_pool.submit(contextvars.copy_context().run, track_lyrics, t): i for i, t in enumerate(tracks)}
+    out = [("", set())] * len(tracks)
+    done, pending = wait(futs, timeout=deadline)
+    for f in done:
+        try:
+            out[futs[f]] = f.result()
+        except Exception:
+            pass
+    for f in pending:
+        f.cancel()
+    return out
+
+
+_catalogue = None
+_catalogue_lock = threading.Lock()
+
+
+def get_catalogue():
+    global _catalogue
+    if _catalogue is None:
+        with _catalogue_lock:
+            if _catalogue is None:
+                from lib.catalogue import Catalogue
+                _catalogue = Catalogue()
+    return _catalogue
+
+
+@timed("match.embedding")
+def embed_journal(txt):
+    """Journal embedding and the keys of its EMBED_TOP_K nearest indexed lyrics ((None, []) without an index)."""
+    embedding_index.refresh()
+    if not len(embedding_index):
+        return None, []
+    vec = embed_query(txt)
+    return vec, [key for key, _ in embedding_index.top_k(vec, EMBED_TOP_K)]
+
+
+def lyric_similarity(vec, tracks):
+    if vec is None:
+        return np.zeros(len(tracks))
+    keys = [norm_key(t["title"], t["artist"]) for t in tracks]
+    return embedding_index.similarity(vec, keys)
+
+
+def neighbour_rows(keys, have):
+    """Catalogue rows for embedding neighbours whose key is not in `have`.
+
+    Only the catalogue has links and popularity for arbitrary tracks; without
+    one (and so as not to create an empty one) neighbours add nothing.
+    """
+    from lib.catalogue import CATALOGUE_PATH
+    if not keys or (_catalogue is None and not os.path.exists(CATALOGUE_PATH)):
+        return []
+    return [row for row in get_catalogue().by_keys([k for k in keys if k not in have])
+            if is_english_song(row["title"], row["artist"])]
+
+
+def catalogue_track(row):
+    return {
+        "title": row["title"],
+        "artist": row["artist"],
+        "popularity": row["popularity"],
+        "link": row["link"]
+    }
+
+
+@timed("match.catalogue")
+def catalogue_tracks(emotion, sentiment, neighbours=()):
+    from lib.invindex import get_lyric_index
+    cat = get_catalogue()
+    rows = [row for row in cat.candidates(mood_queries(emotion, sentiment), limit=MATCH_CANDIDATES)
+            if is_english_song(row["title"], row["artist"])]
+    rows += neighbour_rows(neighbours, {row["norm_key"] for row in rows})
+    tracks, lyrics, ids, updated, words = [], [], [], [], []
+    for row in rows:
+        tracks.append(catalogue_track(row))
+        lyrics.append(row["lyrics"] or "")
+        ids.append(row["id"])
+        updated.append(row["updated_at"])
+        words.append(row["words"])
+    # Overlap comes from the lyric inverted index when one has been built
+    # (`python -m lib.invindex build`), else from the cached term matrix.
+    index = get_lyric_index()
+    if len(index):
+        return tracks, lyrics, index.terms(ids, updated, words)
+    return tracks, lyrics, cat.term_matrix().rows(ids)
+
+
+def match(txt, ana_fn, backend=None):
+    res = ana_fn(txt)
+    # With an embedding index, the journal's nearest catalogue lyrics join
+    # the mood candidates and every candidate gets a similarity bonus.
+    vec, neighbours = embed_journal(txt)
     
-    popular_tracks = get_popular_songs_by_emotion(res["emotion"], res["sentiment"], s_tok)
+    if (backend or MATCH_BACKEND) == "catalogue":
+        popular_tracks, lyrics, terms = catalogue_tracks(res["emotion"], res["sentiment"], neighbours)
+    else:
+        popular_tracks = candidate_pools.get(res["emotion"], res["sentiment"])
+        if popular_tracks is None:
+            s_tok = get_spot_token() 
+            if not s_tok:
+                return "Spotify unavailable"
+            
+            try:
+                popular_tracks = get_popular_songs_by_emotion(res["emotion"], res["sentiment"], s_tok)
+            except UpstreamError:
+                return "Spotify unavailable"
+            if popular_tracks:
+                candidate_pools.put(res["emotion"], res["sentiment"], popular_tracks, save=False)
+        all_lyrics = fetch_lyrics(popular_tracks) if popular_tracks else []
+        extra = neighbour_rows(neighbours, {norm_key(t["title"], t["artist"]) for t in popular_tracks or ()})
+        popular_tracks = (popular_tracks or []) + [catalogue_track(row) for row in extra]
+        lyrics = [l for l, _ in all_lyrics] + [row["lyrics"] or "" for row in extra]
+        terms = TermMatrix.from_sets([w for _, w in all_lyrics] + [(row["words"] or "").split() for row in extra])
     
     if not popular_tracks:
         return "No popular songs found for your mood."
     
-    journal_words = set(word.lower() for word in res["tokens"] if len(word) > 3)
-    keywords_lower = [kw.lower() for kw in res["keywords"][:3]]
-    
-    scored_tracks = []
-    
-    for track in popular_tracks:
-        score = track["popularity"]
-        
-        title_lower = track["title"].lower()
-        for keyword in keywords_lower:
-            if keyword in title_lower:
-                score += 50
-        
-        artist_lower = track["artist"].lower()
-        for keyword in keywords_lower:
-            if keyword in artist_lower:
-                score += 30
-        
-        genius_hits = g_search(f"{track['title']} {track['artist']}")
-        
-        if genius_hits:
-            lyrics = get_lyrics(genius_hits[0][2])
-            if lyrics:
-                lyrics_lower = lyrics.lower()
-                if res["emotion"].lower() in lyrics_lower:
-                    score += 25
-                if res["sentiment"].lower() in lyrics_lower:
-                    score += 15
-                
-                lyrics_words = set(re.findall(r'\b\w{4,}\b', lyrics_lower))
-                overlap = len(journal_words & lyrics_words)
-                score += overlap * 2
-        
-        scored_tracks.append((track, score))
-    
-    scored_tracks.sort(key=lambda x: x[1], reverse=True)
-    top_tracks = scored_tracks[:15]
-    
-    if not top_tracks:
+    sims = lyric_similarity(vec, popular_tracks)
+    with span("match.score"):
+        scores = score_tracks(popular_tracks, lyrics, terms, res, LIB_WEIGHTS, extra=np.trunc(sims * EMBED_WEIGHT))
+        top = rank_tracks(popular_tracks, scores, 15)
+    
+    if not top:
         return "No songs found for your mood."
     
-    return top_tracks
+    return top
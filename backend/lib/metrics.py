@@ -0,0 +1,142 @@
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# ECHO_METRICS=0 turns span()/timed() into no-ops: timed() returns the
+# function undecorated and span() a shared null context, so the hot path
+# pays one global lookup at most.
+METRICS_ENABLED = os.getenv("ECHO_METRICS", "1") == "1"
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Spans recorded during the current request, for the Server-Timing header.
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+_NOOP = nullcontext()
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram keyed by one label value (the stage)."""
+
+    def __init__(self, name, help, label, buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, value):
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, [list(s[0]), s[1], s[2]]) for k, s in self._series.items())
+        for key, (counts, total, n) in items:
+            acc = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{self.label}="{key}",le="{le}"}} {acc}')
+            lines.append(f'{self.name}_sum{{{self.label}="{key}"}} {total}')
+            lines.append(f'{self.name}_count{{{self.label}="{key}"}} {n}')
+        return lines
+
+
+stage_seconds = Histogram("echo_stage_seconds", "Time spent per pipeline stage.", "stage")
+http_seconds = Histogram("echo_http_request_seconds", "HTTP request latency per route.", "route")
+
+_caches = {}
+
+
+def register_cache(name, stats):
+    """Export `stats()` hits/misses/size (read at scrape time) as echo_cache_* series."""
+    _caches[name] = stats
+
+
+def _cache_lines():
+    samples = {"hits": [], "misses": [], "size": []}
+    for name, stats in sorted(_caches.items()):
+        try:
+            s = stats()
+        except Exception:
+            continue
+        for field in samples:
+            if s.get(field) is not None:
+                samples[field].append((name, s[field]))
+    lines = []
+    for field, kind, help in (("hits", "counter", "Cache hits."), ("misses", "counter", "Cache misses."),
+                              ("size", "gauge", "Entries currently cached.")):
+        name = f"echo_cache_{field}_total" if kind == "counter" else f"echo_cache_{field}"
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        lines += [f'{name}{{cache="{cache}"}} {value}' for cache, value in samples[field]]
+    return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(stage_seconds.render() + http_seconds.render() + _cache_lines()) + "\n"
+
+
+@contextmanager
+def _span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(name, elapsed)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+
+
+def span(name):
+    """Time a block as stage `name`: histogram plus the request's Server-Timing."""
+    return _span(name) if METRICS_ENABLED else _NOOP
+
+
+def timed(name):
+    """Decorator form of span(); returns the function unchanged when metrics are off."""
+    def wrap(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with _span(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def start_request():
+    """Begin collecting spans for the current context; returns the list and a reset token."""
+    spans = []
+    return spans, _request_spans.set(spans)
+
+
+def end_request(token):
+    _request_spans.reset(token)
+
+
+def server_timing(spans, total):
+    """Server-Timing header value: per-stage summed duration and call count, plus the total."""
+    agg = {}
+    for name, elapsed in spans:
+        d = agg.setdefault(name, [0.0, 0])
+        d[0] += elapsed
+        d[1] += 1
+    parts = [f'{name};dur={d[0] * 1000:.1f};desc="x{d[1]}"' for name, d in agg.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
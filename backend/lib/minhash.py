@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import threading
+import zlib
+
+import numpy as np
+
+from lib.db import DB_PATH
+
+MINHASH_DIR = os.getenv("ECHO_MINHASH", os.path.join(os.path.dirname(DB_PATH), "minhash"))
+MINHASH_PERM = int(os.getenv("MINHASH_PERM", "128"))
+# Journal/lyric Jaccard is small (a short entry against a whole song), so the
+# cut-off is low. A band of `rows` values collides with probability J**rows,
+# putting the LSH midpoint near (1/bands)**(1/rows); 32 single-value bands
+# (midpoint ~0.03, a little under the threshold) keep recall high. On a
+# synthetic 5000-track Zipf catalogue that gave LSH recall 0.91 at the 0.05
+# threshold while scanning 25% of the tracks; 64 bands of 2 (midpoint 0.125)
+# managed 0.33. Banding uses the first bands*rows permutations, the estimate
+# all of them. bench/minhash_recall.py reports these numbers per setting.
+MINHASH_BANDS = int(os.getenv("MINHASH_BANDS", "32"))
+MINHASH_ROWS = int(os.getenv("MINHASH_ROWS", "1"))
+MINHASH_THRESHOLD = float(os.getenv("MINHASH_THRESHOLD", "0.05"))
+
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_EMPTY = np.uint32(0xFFFFFFFF)
+
+
+def permutations(num_perm, seed=1):
+    """(a, b) for the universal hashes (a*x + b) mod p; a < 2**31 keeps a*x inside uint64."""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 2**31, size=num_perm).astype(np.uint64)
+    b = rng.randint(0, 2**32, size=num_perm, dtype=np.int64).astype(np.uint64)
+    return a, b
+
+
+def word_hashes(words):
+    return np.fromiter((zlib.crc32(w.encode()) for w in words), dtype=np.uint64)
+
+
+def signature(words, perms):
+    """MinHash signature (uint32 per permutation) of a word set."""
+    a, b = perms
+    h = word_hashes(set(words))
+    if not len(h):
+        return np.full(len(a), _EMPTY, dtype=np.uint32)
+    return ((a[:, None] * h[None, :] + b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_keys(sigs, bands, rows):
+    """One uint64 key per (row, band) by mixing the band's `rows` signature values."""
+    n = sigs.shape[0]
+    keys = np.zeros((n, bands), dtype=np.uint64)
+    view = sigs[:, :bands * rows].reshape(n, bands, rows).astype(np.uint64)
+    for r in range(rows):
+        keys = keys * np.uint64(0x100000001B3) ^ view[:, :, r]
+    return keys
+
+
+class MinHashIndex:
+    """MinHash signatures of catalogue lyrics with an LSH banding index.
+
+    `signatures.npy` is an (n, num_perm) uint32 array and `ids.npy` the
+    catalogue track id of each row. For LSH, each band's keys are kept
+    sorted with their row order, so a lookup is a binary search per band
+    instead of a scan over the catalogue. Candidates are ranked by the
+    fraction of matching signature values (the Jaccard estimate).
+    """
+
+    def __init__(self, path=MINHASH_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self.meta = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.sigs = None
+        self.reload()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def reload(self):
+        try:
+            with open(self._file("meta.json")) as f:
+                meta = json.load(f)
+            ids = np.load(self._file("ids.npy"))
+            sigs = np.load(self._file("signatures.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return
+        meta.setdefault("rows", meta["num_perm"] // meta["bands"])  # indexes built before rows was stored
+        self.meta, self.ids, self.sigs = meta, ids, sigs
+        self.perms = permutations(meta["num_perm"], meta["seed"])
+        keys = band_keys(np.asarray(sigs), meta["bands"], meta["rows"])
+        self._order = np.argsort(keys, axis=0, kind="stable")
+        self._sorted = np.take_along_axis(keys, self._order, axis=0)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def build(self, items, num_perm=MINHASH_PERM, bands=MINHASH_BANDS, rows=MINHASH_ROWS, seed=1):
+        """Compute signatures for every (track_id, words) in `items` and write the index."""
+        if bands * rows > num_perm:
+            raise ValueError("bands * rows must not exceed num_perm")
+        perms = permutations(num_perm, seed)
+        ids, sigs = [], []
+        for track_id, words in items:
+            ids.append(track_id)
+            sigs.append(signature(words, perms))
+        sigs = np.stack(sigs) if sigs else np.zeros((0, num_perm), dtype=np.uint32)
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            np.save(self._file("signatures.npy"), sigs)
+            np.save(self._file("ids.npy"), np.array(ids, dtype=np.int64))
+            with open(self._file("meta.json"), "w") as f:
+                json.dump({"num_perm": num_perm, "bands": bands, "rows": rows, "seed": seed}, f)
+            self.reload()
+        return len(ids)
+
+    def candidates(self, words):
+        """Rows sharing at least one LSH band with `words`, and the query signature."""
+        sig = signature(words, self.perms)
+        q = band_keys(sig[None, :], self.meta["bands"], self.meta["rows"])[0]
+        rows = []
+        for band, key in enumerate(q):
+            col = self._sorted[:, band]
+            lo, hi = np.searchsorted(col, key, side="left"), np.searchsorted(col, key, side="right")
+            if hi > lo:
+                rows.append(self._order[lo:hi, band])
+        rows = np.unique(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64)
+        return rows, sig
+
+    def query(self, words, threshold=MINHASH_THRESHOLD, limit=None):
+        """Catalogue ids whose estimated Jaccard with `words` is at least `threshold`.
+
+        Returns (ids, estimates), highest estimate first.
+        """
+        words = set(words)
+        if not len(self) or not words:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        rows, sig = self.candidates(words)
+        est = (np.asarray(self.sigs[rows]) == sig).mean(axis=1) if len(rows) else np.zeros(0)
+        # The estimate has standard error sqrt(J(1-J)/num_perm); cutting one
+        # error below the threshold keeps most true matches near it.
+        keep = est >= threshold - np.sqrt(threshold * (1 - threshold) / len(sig))
+        rows, est = rows[keep], est[keep]
+        order = np.argsort(-est, kind="stable")[:limit]
+        return self.ids[rows[order]], est[order]
+
+
+minhash_index = MinHashIndex()
+
+
+def catalogue_items():
+    from lib.catalogue import Catalogue
+    for row in Catalogue().iter_lyrics():
+        yield row["id"], (row["words"] or "").split()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the MinHash/LSH index over catalogue lyrics.")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--perm", type=int, default=MINHASH_PERM)
+    parser.add_argument("--bands", type=int, default=MINHASH_BANDS)
+    parser.add_argument("--rows", type=int, default=MINHASH_ROWS)
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        print(f"indexed {minhash_index.build(catalogue_items(), args.perm, args.bands, args.rows)} tracks")
+    else:
+        print(json.dumps({"size": len(minhash_index), "meta": minhash_index.meta}))
+
+
+if __name__ == "__main__":
+    main()
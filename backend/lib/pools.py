@@ -0,0 +1,132 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from lib.db import DB_PATH
+
+POOL_PATH = os.getenv("ECHO_POOLS", os.path.join(os.path.dirname(DB_PATH), "pools.json"))
+POOL_REFRESH = float(os.getenv("POOL_REFRESH", str(6 * 3600)))
+# First retry delay after a pass that left a pool empty; doubles per failed
+# pass up to the refresh interval.
+POOL_RETRY = float(os.getenv("POOL_RETRY", "60"))
+
+
+class PoolService:
+    """Popularity-sorted candidate tracks for every (emotion, sentiment) pair.
+
+    Pools are persisted as JSON so they survive restarts, and a background
+    thread re-fetches them every `interval` seconds. Pairs that resolve to
+    the same search (same `group` key) share one fetch per refresh. A pool
+    older than four refresh intervals is treated as cold. A pass where any
+    fetch comes back empty is retried after a capped exponential backoff
+    rather than immediately. Pools put() from the request path with
+    save=False are persisted by the next refresh pass or by stop().
+    """
+
+    def __init__(self, fetch, pairs, group=None, path=POOL_PATH, interval=POOL_REFRESH):
+        self._fetch = fetch
+        self.pairs = list(pairs)
+        self._group = group or (lambda emotion, sentiment: (emotion, sentiment))
+        self.path = path
+        self.interval = interval
+        self._pools = {}
+        self._last_pass = None
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread = None
+        self._load()
+
+    @staticmethod
+    def _key(emotion, sentiment):
+        return f"{emotion}|{sentiment}"
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                self._pools = json.load(f)
+        except (OSError, ValueError):
+            self._pools = {}
+
+    def _save(self):
+        with self._save_lock:
+            with self._lock:
+                data = json.dumps(self._pools)
+                self._dirty = False
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(data)
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+    def get(self, emotion, sentiment):
+        pool = self._pools.get(self._key(emotion, sentiment))
+        if pool is None:
+            return None
+        if self.interval and time.time() - pool["refreshed_at"] > 4 * self.interval:
+            return None
+        return pool["tracks"]
+
+    def put(self, emotion, sentiment, tracks, save=True):
+        with self._lock:
+            self._pools[self._key(emotion, sentiment)] = {"tracks": tracks, "refreshed_at": time.time()}
+            self._dirty = True
+        if save:
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._pools = {}
+
+    def refresh(self):
+        fetched = {}
+        failed = False
+        for emotion, sentiment in self.pairs:
+            group = self._group(emotion, sentiment)
+            if group not in fetched:
+                try:
+                    fetched[group] = self._fetch(emotion, sentiment)
+                except Exception:
+                    fetched[group] = []
+                failed = failed or not fetched[group]
+            if fetched[group]:
+                self.put(emotion, sentiment, fetched[group], save=False)
+        self._save()
+        self._failures = self._failures + 1 if failed else 0
+        self._last_pass = time.time()
+
+    def _next_delay(self):
+        now = time.time()
+        if self._last_pass is None:
+            if len(self._pools) < len(self.pairs):
+                return 0
+            due = min(pool["refreshed_at"] for pool in self._pools.values()) + self.interval
+        elif self._failures:
+            due = self._last_pass + min(self.interval, POOL_RETRY * 2 ** (self._failures - 1))
+        else:
+            due = self._last_pass + self.interval
+        return max(0, due - now)
+
+    def _run(self):
+        while not self._stop.wait(self._next_delay()):
+            self.refresh()
+
+    def start(self):
+        if not self.interval or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="candidate-pools", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+        if self._dirty:
+            self._save()
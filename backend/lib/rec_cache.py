@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from lib.db import DB_PATH, connect
+from lib.metrics import register_cache
+from lib.pools import POOL_REFRESH
+
+REC_TTL = float(os.getenv("REC_TTL", str(POOL_REFRESH)))
+REC_CACHE_MAX = int(os.getenv("REC_CACHE_MAX", "512"))
+REC_PERSIST = os.getenv("REC_PERSIST", "1") == "1"
+
+
+def rec_key(text, analysis, version):
+    blob = json.dumps([text, analysis, version], sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class RecCache:
+    """Recommendation results keyed by rec_key().
+
+    An in-memory LRU bounded to `max_size` entries, optionally backed by a
+    `rec_cache` SQLite table so results survive restarts. Entries expire
+    after `ttl` seconds (by default the candidate pool refresh interval)
+    and can be dropped per journal entry with invalidate_entry().
+    """
+
+    def __init__(self, path=DB_PATH, ttl=REC_TTL, max_size=REC_CACHE_MAX, persist=REC_PERSIST):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if persist:
+            self._conn = connect(path)
+            with self._conn:
+                self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS rec_cache (
+                        key TEXT PRIMARY KEY,
+                        entry_id INTEGER,
+                        result TEXT,
+                        expires_at REAL
+                    );
+                    """
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rec_cache_entry ON rec_cache(entry_id)")
+
+    def _remember(self, key, entry_id, result, expires_at):
+        self._mem[key] = (expires_at, entry_id, result)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_size:
+            self._mem.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            found = self._mem.get(key)
+            if found is not None and found[0] > now:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return found[2]
+            self._mem.pop(key, None)
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT entry_id, result, expires_at FROM rec_cache WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+                if row is not None:
+                    result = json.loads(row["result"])
+                    self._remember(key, row["entry_id"], result, row["expires_at"])
+                    self.hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def put(self, key, entry_id, result):
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, entry_id, result, expires_at)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM rec_cache WHERE expires_at <= ?", (now,))
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO rec_cache (key, entry_id, result, expires_at) VALUES (?, ?, ?, ?)",
+                        (key, entry_id, json.dumps(result), expires_at),
+                    )
+
+    def invalidate_entry(self, entry_id):
+        with self._lock:
+            for key in [k for k, v in self._mem.items() if v[1] == entry_id]:
+                del self._mem[key]
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM rec_cache WHERE entry_id = ?", (entry_id,))
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._mem), "max_size": self.max_size}
+
+
+rec_cache = RecCache()
+register_cache("recommendations", rec_cache.stats)
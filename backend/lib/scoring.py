@@ -0,0 +1,157 @@
+import numpy as np
+from scipy import sparse
+
+# Score weights for lib.matcher.match: raw popularity, +50/+30 per keyword (first
+# three) in title/artist, and with lyrics +25 emotion, +15 sentiment, +2 per
+# journal word that also appears in the lyrics.
+LIB_WEIGHTS = {
+    "keywords": 3,
+    "popularity": 1,
+    "popularity_pct": 0,
+    "title": 50,
+    "artist": 30,
+    "emotion": 25,
+    "sentiment": 15,
+    "lyric_keyword": 0,
+    "overlap": 2,
+    "jaccard": 0,
+}
+
+# Score weights for the standalone backend/matcher.py: popularity scaled to 15
+# points, +10/+5 per keyword in title/artist, and with lyrics +20 emotion,
+# +10 sentiment, +5 per keyword, up to +20 for journal/lyrics Jaccard.
+BACKEND_WEIGHTS = {
+    "keywords": None,
+    "popularity": 0,
+    "popularity_pct": 15,
+    "title": 10,
+    "artist": 5,
+    "emotion": 20,
+    "sentiment": 10,
+    "lyric_keyword": 5,
+    "overlap": 0,
+    "jaccard": 20,
+}
+
+
+class _Column:
+    """One lower-cased text field of every candidate, joined into a single string.
+
+    Substring tests scan the joined text with str.find and map each hit back to
+    its row, so the cost is one pass over the text rather than one per track.
+    """
+
+    def __init__(self, values):
+        values = [v.lower() if v else "" for v in values]
+        self.text = "\0".join(values)
+        lengths = np.fromiter((len(v) + 1 for v in values), dtype=np.int64, count=len(values))
+        self.starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        self.ends = self.starts + lengths - 1
+
+    def contains(self, needle):
+        n = len(self.starts)
+        if not needle:
+            return np.ones(n, dtype=bool)
+        hit = np.zeros(n, dtype=bool)
+        i = self.text.find(needle)
+        while i != -1:
+            row = int(np.searchsorted(self.starts, i, side="right")) - 1
+            if i + len(needle) <= self.ends[row]:
+                hit[row] = True
+                i = self.text.find(needle, self.ends[row] + 1)
+            else:
+                i = self.text.find(needle, i + 1)
+        return hit
+
+
+class TermMatrix:
+    """Binary candidate x term CSR matrix of lyric words.
+
+    Journal overlap for every candidate is one sparse mat-vec; `keys` (e.g.
+    catalogue track ids) allow picking a candidate subset by row slicing.
+    """
+
+    def __init__(self, matrix, vocab, keys=None):
+        self.matrix = matrix
+        self.vocab = vocab
+        self.keys = keys
+        self.sizes = np.diff(matrix.indptr)
+        self._rows = {k: i for i, k in enumerate(keys)} if keys is not None else None
+
+    @classmethod
+    def from_sets(cls, word_sets, keys=None):
+        vocab, indices, indptr = {}, [], [0]
+        for words in word_sets:
+            indices.extend({vocab.setdefault(w, len(vocab)) for w in words})
+            indptr.append(len(indices))
+        matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(indptr) - 1, max(len(vocab), 1)),
+        )
+        return cls(matrix, vocab, keys)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def rows(self, keys):
+        idx = np.array([self._rows[k] for k in keys], dtype=np.int64)
+        return TermMatrix(self.matrix[idx], self.vocab, list(keys))
+
+    def overlap(self, words):
+        cols = [self.vocab[w] for w in words if w in self.vocab]
+        if not cols:
+            return np.zeros(len(self), dtype=np.float64)
+        q = np.zeros(self.matrix.shape[1], dtype=np.float32)
+        q[cols] = 1
+        return np.asarray(self.matrix @ q, dtype=np.float64)
+
+
+def score_tracks(tracks, lyrics, terms, res, weights, extra=None):
+    """Score every candidate in one pass; returns an int64 array aligned with `tracks`.
+
+    `lyrics` holds each track's lyrics ("" when missing) and `terms` the
+    matching TermMatrix of lyric words. Lyric components only count for
+    tracks that have lyrics, as in the original per-track loops.
+    """
+    n = len(tracks)
+    if not n:
+        return np.zeros(0, dtype=np.int64)
+
+    keywords = [kw.lower() for kw in res["keywords"]][:weights["keywords"]]
+    titles = _Column([t["title"] for t in tracks])
+    artists = _Column([t["artist"] for t in tracks])
+    lyric_text = _Column(lyrics)
+    has_lyrics = np.array([bool(l) for l in lyrics])
+
+    pop = np.array([t.get("popularity") or 0 for t in tracks], dtype=np.float64)
+    score = pop * weights["popularity"] + np.floor(pop / 100 * weights["popularity_pct"])
+
+    for kw in keywords:
+        score += weights["title"] * titles.contains(kw) + weights["artist"] * artists.contains(kw)
+
+    lyric = np.zeros(n)
+    lyric += weights["emotion"] * lyric_text.contains(res["emotion"].lower())
+    lyric += weights["sentiment"] * lyric_text.contains(res["sentiment"].lower())
+    if weights["lyric_keyword"]:
+        for kw in keywords:
+            lyric += weights["lyric_keyword"] * lyric_text.contains(kw)
+
+    if weights["overlap"] or weights["jaccard"]:
+        journal = set(w.lower() for w in res["tokens"] if len(w) > 3)
+        common = terms.overlap(journal)
+        lyric += weights["overlap"] * common
+        if weights["jaccard"]:
+            union = len(journal) + terms.sizes - common
+            jaccard = np.divide(common, union, out=np.zeros(n), where=(union > 0) & (terms.sizes > 0))
+            lyric += np.floor(jaccard * weights["jaccard"])
+
+    score += np.where(has_lyrics, lyric, 0)
+    if extra is not None:
+        score += extra
+    return score.astype(np.int64)
+
+
+def rank_tracks(tracks, scores, k=15):
+    """Highest `k` (track, score) pairs, ties kept in candidate order like list.sort."""
+    order = np.argsort(-scores, kind="stable")[:k]
+    return [(tracks[i], int(scores[i])) for i in order]
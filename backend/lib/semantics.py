@@ -1,62 +1,201 @@
+import os
 import re
+import threading
+import time
 import nltk
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-from sklearn.feature_extraction.text import TfidfVectorizer
-from transformers import pipeline
-nltk.download('punkt')
-nltk.download('stopwords')
-nltk.download('wordnet')
+from lib.batcher import Batcher
+from lib.metrics import span, timed
 
+EMO_MAX_BATCH = int(os.getenv("EMO_MAX_BATCH", "16"))
+EMO_MAX_WAIT_MS = float(os.getenv("EMO_MAX_WAIT_MS", "5"))
+# Upper bound on waiting for a batched emotion result; generous because the
+# first batch may also load the model.
+EMO_TIMEOUT = float(os.getenv("EMO_TIMEOUT", "120"))
+ANA_CHUNK = int(os.getenv("ANA_CHUNK", "64"))
+
+
+class Models:
+    """Registry of NLP resources, loaded on first use or all at once by warm().
+
+    Load time per resource is kept in `timings`; `ready` turns true once
+    every registered resource is loaded. Each resource loads under its own
+    lock, so a cheap one never waits behind the emotion model.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._loaded = {}
+        self.timings = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+
+    def _lock_for(self, name):
+        with self._lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        if name in self._loaded:
+            return self._loaded[name]
+        with self._lock_for(name):
+            if name not in self._loaded:
+                start = time.perf_counter()
+                self._loaded[name] = self._loaders[name]()
+                self.timings[name] = round(time.perf_counter() - start, 3)
+        return self._loaded[name]
+
+    def warm(self):
+        for name in self._loaders:
+            self.get(name)
+        return dict(self.timings)
+
+    @property
+    def ready(self):
+        return all(name in self._loaded for name in self._loaders)
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "loaded": dict(self.timings),
+            "pending": [name for name in self._loaders if name not in self._loaded],
+        }
+
+
+def ensure_nltk(resource, path):
+    try:
+        nltk.data.find(path)
+    except LookupError:
+        nltk.download(resource, quiet=True)
+
+
+def load_stopwords():
+    ensure_nltk('stopwords', 'corpora/stopwords')
+    return set(stopwords.words("english"))
+
+
+def load_lemmatizer():
+    ensure_nltk('wordnet', 'corpora/wordnet')
+    lem = WordNetLemmatizer()
+    lem.lemmatize("warm")
+    return lem
+
+
+def load_punkt():
+    ensure_nltk('punkt', 'tokenizers/punkt')
+    return nltk.word_tokenize
+
+
+def load_vader():
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+    return SentimentIntensityAnalyzer()
+
+
+def load_idf():
+    from lib.idf import IdfIndex
+    return IdfIndex(clean=clean)
+
+
+def load_emotion():
+    from transformers import pipeline
+    return pipeline("text-classification", model="j-hartmann/emotion-english-distilroberta-base", top_k=1)
+
+
+models = Models()
+models.register("stopwords", load_stopwords)
+models.register("lemmatizer", load_lemmatizer)
+models.register("punkt", load_punkt)
+models.register("vader", load_vader)
+models.register("idf", load_idf)
+models.register("emotion", load_emotion)
+
+
+@timed("ana.clean")
 def clean(txt):
     txt = txt.lower()
     txt = re.sub(r"[^\w\s]", "", txt)
     txt = re.sub(r"\d+", "", txt)
     return txt.strip()
 
-sw = set(stopwords.words("english"))
-lem = WordNetLemmatizer()
-
 
+@timed("ana.process")
 def process(txt):
-    wrd = nltk.word_tokenize(txt)
+    sw = models.get("stopwords")
+    lem = models.get("lemmatizer")
+    wrd = models.get("punkt")(txt)
     flt = [w for w in wrd if w not in sw]
     lemz = [lem.lemmatize(w) for w in flt]
     return lemz
 
 
+@timed("ana.key")
 def key(txt, top=5):
-    vec = TfidfVectorizer(stop_words='english')
-    mat = vec.fit_transform([txt])
-    scs = zip(vec.get_feature_names_out(), mat.toarray()[0])
-    srt = sorted(scs, key=lambda x: x[1], reverse=True)
-    return [w for w, _ in srt[:top]]
+    return models.get("idf").keywords(txt, top)
 
-snt = SentimentIntensityAnalyzer()
 
-def sent(txt):
-    sc = snt.polarity_scores(txt)
+@timed("ana.sent")
+def sent_scored(txt):
+    sc = models.get("vader").polarity_scores(txt)
     if sc['compound'] >= 0.5:
-        return "positive"
+        return "positive", sc
     elif sc['compound'] <= -0.5:
-        return "negative"
+        return "negative", sc
     else:
-        return "neutral"
-emo_pipe = pipeline("text-classification", model="j-hartmann/emotion-english-distilroberta-base", top_k=1)
+        return "neutral", sc
+
+def sent(txt):
+    return sent_scored(txt)[0]
+
+@timed("ana.emo_batch")
+def emo_batch(txts, batch_size=None):
+    res = models.get("emotion")(list(txts), batch_size=batch_size or len(txts), truncation=True)
+    return [r[0] for r in res]
+
+emo_batcher = Batcher(emo_batch, EMO_MAX_BATCH, EMO_MAX_WAIT_MS / 1000, name="emotion-batcher")
 
 def emo(txt):
-    res = emo_pipe(txt)
-    return res[0][0]['label']
+    with span("ana.emo"):
+        return emo_batcher.submit(txt).result(timeout=EMO_TIMEOUT)['label']
 def ana(txt):
     txt = clean(txt)
     tok = process(txt)
     kw = key(txt)
-    se = sent(txt)
-    emt = emo(txt)
+    se, sc = sent_scored(txt)
+    with span("ana.emo"):
+        emt = emo_batcher.submit(txt).result(timeout=EMO_TIMEOUT)
     return {
         "tokens": tok,
         "keywords": kw,
         "sentiment": se,
-        "emotion": emt
-    }   
\ No newline at end of file
+        "emotion": emt['label'],
+        "scores": {"sentiment": sc, "emotion": emt['score']}
+    }
+
+
+@timed("ana.key_batch")
+def key_batch(txts, top=5):
+    idf = models.get("idf")
+    return [idf.keywords(txt, top) for txt in txts]
+
+
+def iter_ana(txts, chunk=ANA_CHUNK):
+    for i in range(0, len(txts), chunk):
+        cleaned = [clean(t) for t in txts[i:i + chunk]]
+        kws = key_batch(cleaned)
+        emts = emo_batch(cleaned, batch_size=EMO_MAX_BATCH)
+        for txt, kw, emt in zip(cleaned, kws, emts):
+            se, sc = sent_scored(txt)
+            yield {
+                "tokens": process(txt),
+                "keywords": kw,
+                "sentiment": se,
+                "emotion": emt['label'],
+                "scores": {"sentiment": sc, "emotion": emt['score']}
+            }
+
+
+def ana_batch(txts, chunk=ANA_CHUNK):
+    return list(iter_ana(list(txts), chunk))
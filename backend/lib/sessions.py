@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from lib.db import DB_PATH, connect
+
+SESSION_CACHE_MAX = int(os.getenv("SESSION_CACHE_MAX", "10000"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "60"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "600"))
+SESSION_SWEEP_BATCH = int(os.getenv("SESSION_SWEEP_BATCH", "500"))
+
+
+class SessionCache:
+    """Bounded TTL cache of session rows, looked up by token or by user.
+
+    Entries live for at most `ttl` seconds and are never served past the
+    session's own expiryDate, so a logout on another worker is picked up
+    within one TTL.
+    """
+
+    def __init__(self, max_size=SESSION_CACHE_MAX, ttl=SESSION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            found = self._items.get(key)
+            if found is not None:
+                cached_at, session = found
+                if now - cached_at <= self.ttl and session["expiryDate"] > datetime.utcnow().isoformat():
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return session
+                del self._items[key]
+            self.misses += 1
+            return None
+
+    def put(self, session):
+        now = time.monotonic()
+        with self._lock:
+            for key in (("token", session["token"]), ("user", session["user_id"])):
+                self._items[key] = (now, session)
+                self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def drop_user(self, user_id):
+        with self._lock:
+            for key in [k for k, (_, s) in self._items.items() if s["user_id"] == user_id]:
+                del self._items[key]
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._items), "max_size": self.max_size}
+
+
+class SessionSweeper:
+    """Background thread deleting expired session rows in small batches."""
+
+    def __init__(self, path=DB_PATH, interval=SESSION_SWEEP_INTERVAL, batch=SESSION_SWEEP_BATCH):
+        self.path = path
+        self.interval = interval
+        self.batch = batch
+        self.deleted = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sweep(self):
+        conn = connect(self.path)
+        try:
+            while not self._stop.is_set():
+                with conn:
+                    cur = conn.execute(
+                        "DELETE FROM sessions WHERE id IN "
+                        "(SELECT id FROM sessions WHERE expiryDate < ? LIMIT ?)",
+                        (datetime.utcnow().isoformat(), self.batch),
+                    )
+                self.deleted += cur.rowcount
+                if cur.rowcount < self.batch:
+                    break
+        finally:
+            conn.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sweep()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if not self.interval or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
@@ -0,0 +1,45 @@
+import threading
+import time
+
+
+class TokenCache:
+    """Process-wide cache for an expiring bearer token.
+
+    `fetch` returns `(token, expires_in)`; the token is refreshed `margin`
+    seconds before it expires. Refreshes are single-flight: concurrent
+    callers that find the token stale wait on the one refresh in progress.
+    """
+
+    def __init__(self, fetch, margin=60):
+        self._fetch = fetch
+        self.margin = margin
+        self._lock = threading.Lock()
+        self._token = None
+        self._expires_at = 0.0
+        self.refreshes = 0
+        self.hits = 0
+
+    def _valid(self):
+        return self._token is not None and time.monotonic() < self._expires_at - self.margin
+
+    def get(self):
+        if self._valid():
+            self.hits += 1
+            return self._token
+        with self._lock:
+            if self._valid():
+                return self._token
+            token, expires_in = self._fetch()
+            self.refreshes += 1
+            if token:
+                self._token = token
+                self._expires_at = time.monotonic() + float(expires_in or 0)
+            return token
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.refreshes}
+
+    def invalidate(self):
+        with self._lock:
+            self._token = None
+            self._expires_at = 0.0
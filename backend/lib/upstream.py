@@ -0,0 +1,273 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests  #type: ignore
+from requests.adapters import HTTPAdapter  #type: ignore
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.25"))
+# Longest single wait (Retry-After, backoff or rate limiter) a call will sit
+# through; anything longer fails the call instead, keeping tail latency bounded.
+HTTP_MAX_WAIT = float(os.getenv("HTTP_MAX_WAIT", "5"))
+HTTP_RATE = float(os.getenv("HTTP_RATE", "20"))
+HTTP_BURST = int(os.getenv("HTTP_BURST", "40"))
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """A provider call failed after retries (network error, 429 or 5xx)."""
+
+    def __init__(self, host, detail, status=None):
+        super().__init__(f"{host}: {detail}")
+        self.host = host
+        self.status = status
+
+
+class CircuitOpen(UpstreamError):
+    """The host's circuit breaker is open; the call was not attempted."""
+
+
+class _LocalLimit(UpstreamError):
+    """Our own rate limiter refused the call; says nothing about the provider's health."""
+
+
+class TokenBucket:
+    """`rate` requests per second with bursts up to `burst`; pause() blocks the bucket for Retry-After."""
+
+    def __init__(self, rate=HTTP_RATE, burst=HTTP_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_time(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * max(self.rate, 0))
+        self._updated = now
+        wait = max(self._paused_until - now, 0.0)
+        if self.rate > 0 and self._tokens < 1:
+            wait = max(wait, (1 - self._tokens) / self.rate)
+        return wait
+
+    def acquire(self, max_wait=HTTP_MAX_WAIT):
+        """Take one token, sleeping if needed; False if that would take longer than `max_wait`.
+
+        A rate of 0 or less disables the limit (Retry-After pauses still apply).
+        """
+        if self.rate <= 0 and self._paused_until <= time.monotonic():
+            return True
+        while True:
+            with self._lock:
+                wait = self._wait_time(time.monotonic())
+                if wait <= 0:
+                    self._tokens -= 1
+                    return True
+            if wait > max_wait:
+                return False
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; one trial call is let through after `reset` seconds."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened_at = None
+        self.opens = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset else "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def release(self):
+        """End a call that recorded neither success nor failure, freeing the half-open trial slot."""
+        with self._lock:
+            self._trial = False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                if self.opened_at is None or self._trial:
+                    self.opens += 1
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+
+def retry_after(response):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class Host:
+    """Keep-alive session, rate limiter and circuit breaker for one upstream host."""
+
+    def __init__(self, name, rate=HTTP_RATE, burst=HTTP_BURST):
+        self.name = name
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def count(self, requests=0, retries=0, failures=0):
+        with self._lock:
+            self.requests += requests
+            self.retries += retries
+            self.failures += failures
+
+    def stats(self):
+        with self._lock:
+            counts = {"requests": self.requests, "retries": self.retries, "failures": self.failures}
+        return {**counts, "breaker": self.breaker.state, "breaker_opens": self.breaker.opens}
+
+
+class UpstreamClient:
+    """Shared outbound HTTP for Spotify and Genius.
+
+    Each host gets its own pooled keep-alive session, token bucket and
+    circuit breaker. Connection errors, 429 and 5xx are retried up to
+    HTTP_RETRIES times with jittered exponential backoff, honouring
+    Retry-After (a 429 also pauses the host's bucket so concurrent callers
+    back off together). A call that still fails raises UpstreamError and
+    counts as one breaker failure (429s and local rate limiting do not);
+    while a host's breaker is open calls raise CircuitOpen immediately.
+    Other responses, including 4xx, are returned to the caller as-is.
+    """
+
+    def __init__(self, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)):
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._hosts = {}
+        self._limits = {}
+        self._lock = threading.Lock()
+
+    def configure(self, url_or_host, rate=HTTP_RATE, burst=HTTP_BURST):
+        """Set the rate limit for a host (takes effect for hosts not yet used)."""
+        host = urlsplit(url_or_host).netloc or url_or_host
+        self._limits[host] = (rate, burst)
+
+    def host(self, url):
+        name = urlsplit(url).netloc
+        h = self._hosts.get(name)
+        if h is None:
+            with self._lock:
+                h = self._hosts.get(name)
+                if h is None:
+                    h = self._hosts[name] = Host(name, *self._limits.get(name, (HTTP_RATE, HTTP_BURST)))
+        return h
+
+    def request(self, method, url, **kwargs):
+        h = self.host(url)
+        kwargs.setdefault("timeout", self.timeout)
+        if not h.breaker.allow():
+            raise CircuitOpen(h.name, "circuit open")
+        recorded = False
+        try:
+            r = self._attempts(h, method, url, kwargs)
+            h.breaker.success()
+            recorded = True
+            return r
+        except UpstreamError as e:
+            # Only provider faults (connection errors, 5xx) trip the breaker;
+            # a 429 or our own limiter means "slow down", not "down".
+            if e.status != 429 and not isinstance(e, _LocalLimit):
+                h.breaker.failure()
+                recorded = True
+            h.count(failures=1)
+            raise
+        finally:
+            if not recorded:
+                h.breaker.release()
+
+    def _attempts(self, h, method, url, kwargs):
+        for attempt in range(self.retries + 1):
+            if not h.bucket.acquire():
+                raise _LocalLimit(h.name, "rate limited locally")
+            h.count(requests=1)
+            last = attempt == self.retries
+            status = delay = None
+            try:
+                r = h.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                if last:
+                    raise UpstreamError(h.name, type(e).__name__) from e
+            else:
+                if r.status_code not in RETRY_STATUSES:
+                    return r
+                status = r.status_code
+                delay = retry_after(r)
+                if status == 429 and delay:
+                    h.bucket.pause(delay)
+                if last:
+                    raise UpstreamError(h.name, f"HTTP {status}", status)
+            if delay is None:
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            if delay > HTTP_MAX_WAIT:
+                raise UpstreamError(h.name, f"retry after {delay:.1f}s exceeds HTTP_MAX_WAIT", status)
+            h.count(retries=1)
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        return {name: h.stats() for name, h in sorted(self._hosts.items())}
+
+
+upstream = UpstreamClient()
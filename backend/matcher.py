@@ -1,7 +1,12 @@
-import requests, base64, re
+import base64, threading
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from api import ana
+from lib.tokens import TokenCache
+from lib.upstream import UpstreamError, upstream
+from lib.lyrics_cache import lyric_words
+from lib.scoring import BACKEND_WEIGHTS, TermMatrix, score_tracks, rank_tracks
+from lib.minhash import MINHASH_THRESHOLD, minhash_index
 
 load_dotenv()
 
@@ -9,10 +14,19 @@ GENIUS_KEY = "af2HLO68CXyzG2HqM8HWtQt8bMgWymjYPpaORbbLMtn2AJx9YklwbJNlH4f9W5Lm"
 SPOT_ID = "815e46212f474369b92d047545b7f637"
 SPOT_SEC = "43c6066f12ae44cb9e08fb5d678a61a1"
 
+# Most catalogue tracks an LSH shortlist hands to exact scoring.
+MINHASH_SHORTLIST = 500
+
+_catalogue = None
+_catalogue_lock = threading.Lock()
+
 
 def g_search(q):
     h = {"Authorization": f"Bearer {GENIUS_KEY}"}
-    r = requests.get("https://api.genius.com/search", headers=h, params={"q": q})
+    try:
+        r = upstream.get("https://api.genius.com/search", headers=h, params={"q": q})
+    except UpstreamError:
+        return []
     if r.status_code != 200: 
         return []
     hits = r.json().get("response", {}).get("hits", [])
@@ -21,7 +35,7 @@ def g_search(q):
 
 def get_lyrics(u):
     try:
-        r = requests.get(u, timeout=10)
+        r = upstream.get(u)
         if r.status_code != 200: return ""
         soup = BeautifulSoup(r.text, "html.parser")
         divs = soup.select("div[data-lyrics-container='true']")
@@ -30,13 +44,26 @@ def get_lyrics(u):
         return ""
 
 
-def get_spot_token():
+def fetch_spot_token():
     a = f"{SPOT_ID}:{SPOT_SEC}"
     b64 = base64.b64encode(a.encode()).decode()
     h = {"Authorization": f"Basic {b64}", "Content-Type": "application/x-www-form-urlencoded"}  
     d = {"grant_type": "client_credentials"}
-    r = requests.post("https://accounts.spotify.com/api/token", headers=h, data=d)
-    return r.json().get("access_token") if r.status_code == 200 else None
+    try:
+        r = upstream.post("https://accounts.spotify.com/api/token", headers=h, data=d)
+    except UpstreamError:
+        return None, 0
+    if r.status_code != 200:
+        return None, 0
+    body = r.json()
+    return body.get("access_token"), body.get("expires_in", 3600)
+
+
+spot_tokens = TokenCache(fetch_spot_token)
+
+
+def get_spot_token():
+    return spot_tokens.get()
 
 
 def is_english_song(title, artist):
@@ -58,39 +85,43 @@ def is_english_song(title, artist):
     return latin_ratio > 0.85 and not has_non_english
 
 
-def get_popular_songs_by_emotion(emotion, sentiment, tok):
-    h = {"Authorization": f"Bearer {tok}"}
-    
-    emotion_queries = {
-        'joy': ['happy songs', 'feel good music', 'upbeat pop'],
-        'sadness': ['sad songs', 'heartbreak songs', 'emotional ballads'], 
-        'anger': ['angry songs', 'rock music', 'metal songs'],
-        'love': ['love songs', 'romantic music', 'love ballads'],
-        'fear': ['anxiety songs', 'sad music', 'emotional songs'],
-        'surprise': ['upbeat music', 'pop songs', 'dance music']
-    }
-    
-    sentiment_queries = {
-        'positive': ['happy music', 'pop hits', 'feel good songs'],
-        'very positive': ['celebration songs', 'party music', 'dance hits'],
-        'negative': ['sad music', 'melancholy songs', 'breakup songs'],
-        'very negative': ['depressing songs', 'dark music', 'sad ballads'],
-        'neutral': ['chill music', 'indie songs', 'alternative music']
-    }
-    
+EMOTION_QUERIES = {
+    'joy': ['happy songs', 'feel good music', 'upbeat pop'],
+    'sadness': ['sad songs', 'heartbreak songs', 'emotional ballads'], 
+    'anger': ['angry songs', 'rock music', 'metal songs'],
+    'love': ['love songs', 'romantic music', 'love ballads'],
+    'fear': ['anxiety songs', 'sad music', 'emotional songs'],
+    'surprise': ['upbeat music', 'pop songs', 'dance music']
+}
+
+SENTIMENT_QUERIES = {
+    'positive': ['happy music', 'pop hits', 'feel good songs'],
+    'very positive': ['celebration songs', 'party music', 'dance hits'],
+    'negative': ['sad music', 'melancholy songs', 'breakup songs'],
+    'very negative': ['depressing songs', 'dark music', 'sad ballads'],
+    'neutral': ['chill music', 'indie songs', 'alternative music']
+}
+
+
+def mood_queries(emotion, sentiment):
     queries = []
-    if emotion in emotion_queries:
-        queries.extend(emotion_queries[emotion])
-    if sentiment in sentiment_queries:
-        queries.extend(sentiment_queries[sentiment])
+    if emotion in EMOTION_QUERIES:
+        queries.extend(EMOTION_QUERIES[emotion])
+    if sentiment in SENTIMENT_QUERIES:
+        queries.extend(SENTIMENT_QUERIES[sentiment])
     
     if not queries:
         queries = ['popular songs', 'top hits']
+    return queries[:2]
+
+
+def get_popular_songs_by_emotion(emotion, sentiment, tok):
+    h = {"Authorization": f"Bearer {tok}"}
     
     all_tracks = []
-    for query in queries[:2]:
+    for query in mood_queries(emotion, sentiment):
         p = {"q": query, "type": "track", "limit": 20, "market": "US"}
-        r = requests.get("https://api.spotify.com/v1/search", headers=h, params=p)
+        r = upstream.get("https://api.spotify.com/v1/search", headers=h, params=p)
         if r.status_code == 200:
             items = r.json().get("tracks", {}).get("items", [])
             for item in items:
@@ -109,60 +140,69 @@ def get_popular_songs_by_emotion(emotion, sentiment, tok):
     return all_tracks[:30]
 
     
+def get_catalogue():
+    global _catalogue
+    if _catalogue is None:
+        with _catalogue_lock:
+            if _catalogue is None:
+                from lib.catalogue import Catalogue
+                _catalogue = Catalogue()
+    return _catalogue
+
+
+def shortlist_tracks(journal_words, emotion, sentiment):
+    """Catalogue tracks whose MinHash estimate clears the threshold, with lyrics and word sets.
+
+    Like the live path, only English tracks found under the mood's searches are kept.
+    """
+    ids, _ = minhash_index.query(journal_words, MINHASH_THRESHOLD, limit=MINHASH_SHORTLIST)
+    cat = get_catalogue()
+    mood = cat.tagged(ids.tolist(), mood_queries(emotion, sentiment))
+    tracks, all_lyrics, word_sets = [], [], []
+    for row in cat.tracks([i for i in ids.tolist() if i in mood]):
+        if not is_english_song(row["title"], row["artist"]):
+            continue
+        tracks.append({
+            "title": row["title"],
+            "artist": row["artist"],
+            "popularity": row["popularity"],
+            "link": row["link"]
+        })
+        all_lyrics.append(row["lyrics"] or "")
+        word_sets.append((row["words"] or "").split())
+    return tracks, all_lyrics, word_sets
+
+
 def match(txt, ana_fn):
     res = ana_fn(txt)
     
-    s_tok = get_spot_token()
-    if not s_tok:
-        return "Spotify unavailable"
-    
-    popular_tracks = get_popular_songs_by_emotion(res["emotion"], res["sentiment"], s_tok)
-    
-    journal_words = set(word.lower() for word in res["tokens"] if len(word) > 3)
-    keywords = [kw.lower() for kw in res["keywords"]]
-    emotion = res["emotion"].lower()
-    sentiment = res["sentiment"].lower()
-    
-    scored_tracks = []
-
-    for track in popular_tracks:
-        score = 0
-        title = track["title"].lower()
-        artist = track["artist"].lower()
-
-        score += int((track["popularity"] / 100) * 15)
-
-        for kw in keywords:
-            if kw in title:
-                score += 10
-            if kw in artist:
-                score += 5
-
-        genius_hits = g_search(f"{track['title']} {track['artist']}")
-        lyrics = get_lyrics(genius_hits[0][2]) if genius_hits else ""
-        lyrics_lower = lyrics.lower()
-
-        if lyrics:
-       
-            if emotion in lyrics_lower:
-                score += 20
-            if sentiment in lyrics_lower:
-                score += 10
-            for kw in keywords:
-                if kw in lyrics_lower:
-                    score += 5
-
-            lyrics_words = set(re.findall(r'\b\w{4,}\b', lyrics_lower))
-            if lyrics_words:
-                common = journal_words & lyrics_words
-                union = journal_words | lyrics_words
-                jaccard = len(common) / len(union) if union else 0
-                score += int(jaccard * 20)
-
-        scored_tracks.append((track, score))
-
-    scored_tracks.sort(key=lambda x: x[1], reverse=True)
-    top_tracks = scored_tracks[:15]
+    # With a MinHash index (python -m lib.minhash build) candidates come from
+    # the catalogue by approximate lyric Jaccard; only that shortlist is
+    # scored exactly. Without an index, or when nothing clears
+    # MINHASH_THRESHOLD, fall back to Spotify + Genius.
+    popular_tracks = None
+    if len(minhash_index):
+        journal_words = set(word.lower() for word in res["tokens"] if len(word) > 3)
+        popular_tracks, all_lyrics, word_sets = shortlist_tracks(journal_words, res["emotion"], res["sentiment"])
+    if not popular_tracks:
+        s_tok = get_spot_token()
+        if not s_tok:
+            return "Spotify unavailable"
+        
+        try:
+            popular_tracks = get_popular_songs_by_emotion(res["emotion"], res["sentiment"], s_tok)
+        except UpstreamError:
+            return "Spotify unavailable"
+        
+        all_lyrics = []
+        for track in popular_tracks:
+            genius_hits = g_search(f"{track['title']} {track['artist']}")
+            all_lyrics.append(get_lyrics(genius_hits[0][2]) if genius_hits else "")
+        word_sets = [lyric_words(lyrics) if lyrics else () for lyrics in all_lyrics]
+
+    terms = TermMatrix.from_sets(word_sets)
+    scores = score_tracks(popular_tracks, all_lyrics, terms, res, BACKEND_WEIGHTS)
+    top_tracks = rank_tracks(popular_tracks, scores, 15)
 
     if not top_tracks:
         return "No songs found for your mood."